@@ -0,0 +1,173 @@
+"""
+Sorting actuator output for `detect.py --actuator`: framed RubbishClass codes written from a background I/O thread.
+
+Frame (9 bytes, little-endian): 0xAA start, uint16 sequence, uint32 capture time (ms, wraps), uint8 code,
+uint8 checksum (sum of the preceding bytes & 0xFF).
+
+Usage:
+    sender = ActuatorSender('/dev/ttyUSB0', baudrate=9600)  # or a pty path, or 'socket://localhost:7777'
+    sender.send(0x01, t=t_capture)  # never blocks
+    sender.close()
+"""
+
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from telemetry import percentiles
+
+try:
+    import serial  # pyserial, optional
+except ImportError:
+    serial = None
+try:
+    import termios  # POSIX, sets up ttys opened without pyserial
+    import tty
+except ImportError:
+    termios = None
+
+START = 0xAA
+HEADER = struct.Struct('<BHIB')  # start, sequence, time, code
+
+
+def encode(seq, t, code):
+    # Frame a code with its sequence number and capture time t (time.time())
+    x = HEADER.pack(START, seq & 0xFFFF, int(t * 1E3) & 0xFFFFFFFF, code)
+    return x + bytes((sum(x) & 0xFF,))
+
+
+def decode(x):
+    # Inverse of encode() for one frame, returns (seq, t_ms, code), raises ValueError on a bad frame
+    if len(x) != HEADER.size + 1 or x[0] != START or sum(x[:-1]) & 0xFF != x[-1]:
+        raise ValueError(f'invalid actuator frame {x.hex()}')
+    return HEADER.unpack(x[:-1])[1:]
+
+
+def speed(baudrate):
+    # termios speed constant of a baud rate, raises ValueError if the rate needs pyserial
+    if termios is None or not hasattr(termios, f'B{baudrate}'):
+        raise ValueError(f'baud rate {baudrate} needs pyserial on this platform, pip install pyserial')
+    return getattr(termios, f'B{baudrate}')
+
+
+def connect(port, baudrate=9600, timeout=1.0):
+    # Open port as a writable stream: pyserial device or URL if installed, else a raw tty/pty path or socket://host:port
+    if serial is not None:
+        return serial.serial_for_url(port, baudrate=baudrate, write_timeout=timeout)
+    if port.startswith('socket://'):
+        host, _, p = port[9:].rpartition(':')
+        s = socket.create_connection((host, int(p)), timeout=timeout)
+        return s.makefile('wb', buffering=0)
+    fd = os.open(port, os.O_WRONLY | os.O_NOCTTY)
+    if os.isatty(fd):  # raw 8N1 at baudrate, a tty keeps the settings of its last user otherwise
+        try:
+            baud = speed(baudrate)
+            tty.setraw(fd)
+            attrs = termios.tcgetattr(fd)
+            attrs[2] |= termios.CLOCAL | termios.CREAD  # ignore modem control lines
+            attrs[4] = attrs[5] = baud  # ispeed, ospeed
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        except Exception:
+            os.close(fd)
+            raise
+    return os.fdopen(fd, 'wb', buffering=0)
+
+
+class ActuatorSender:
+    """Queues actuator codes and writes them in batches from an I/O thread, so the caller never waits on the port.
+
+    Frames waiting in the queue are written together in one call. A failed write closes the port, and the batch is
+    retried on a fresh connection up to `retries` times before it is discarded. When the queue is full the oldest
+    frame is dropped. Latency is measured from the capture time passed to send() to the end of the write.
+    """
+
+    def __init__(self, port, baudrate=9600, maxsize=256, batch=32, retries=3, retry_delay=0.1, n=1000):
+        self.port = port  # device path, pty path, pyserial URL or an already open stream with write()
+        self.baudrate = baudrate
+        self.batch = batch  # max frames per write
+        self.retries = retries
+        self.retry_delay = retry_delay  # seconds between reconnection attempts
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.seq = 0
+        self.sent, self.dropped, self.failed, self.retried = 0, 0, 0, 0  # frames
+        self.latency = deque(maxlen=n)  # recent capture-to-sent latencies (s)
+        self.stream = None if isinstance(port, str) else port
+        if serial is None and isinstance(port, str) and not port.startswith('socket://'):
+            speed(baudrate)  # fail here rather than on every retry in the I/O thread
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send(self, code, t=None):
+        # Queue a code captured at time t (time.time(), default now), returns its sequence number
+        t = time.time() if t is None else t
+        seq, self.seq = self.seq, (self.seq + 1) & 0xFFFF
+        item = (t, encode(seq, t, code))
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return seq
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()  # discard oldest
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        # Write all pending frames and stop the I/O thread
+        self.queue.put(None)
+        self.thread.join()
+        self._disconnect()
+
+    def stats(self):
+        s = f'{self.sent} codes sent, {self.dropped} dropped, {self.failed} failed, {self.retried} retried'
+        if self.latency:
+            p = percentiles(self.latency)
+            s += f", {p['p50']:.1f}ms p50, {p['p95']:.1f}ms p95, {p['max']:.1f}ms max capture-to-sent latency"
+        return s
+
+    def _run(self):
+        done = False
+        while not done:
+            items = [self.queue.get()]
+            while len(items) < self.batch:  # drain what is already queued, up to one batch
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if items[-1] is None:  # close()
+                done = True
+                items.pop()
+            if items:
+                self._write(items)
+
+    def _write(self, items):
+        data = b''.join(x for _, x in items)
+        for attempt in range(self.retries + 1):
+            try:
+                if self.stream is None:
+                    self.stream = connect(self.port, self.baudrate)
+                self.stream.write(data)
+                self.stream.flush()
+                t = time.time()
+                self.sent += len(items)
+                self.latency.extend(t - x for x, _ in items)
+                return
+            except (OSError, ValueError):  # serial.SerialException is an OSError
+                self._disconnect()
+                if attempt < self.retries:
+                    self.retried += len(items)
+                    time.sleep(self.retry_delay)
+        self.failed += len(items)
+
+    def _disconnect(self):
+        if self.stream is not None and isinstance(self.port, str):  # only close streams opened here
+            try:
+                self.stream.close()
+            except OSError:
+                pass
+            self.stream = None
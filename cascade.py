@@ -0,0 +1,119 @@
+"""
+Coarse-to-fine inference for `detect.py --cascade-imgsz/--roi`: a low-resolution pass over the bin opening only, then
+high-resolution tiles around the candidates the coarse pass is unsure of, so most frames cost a fraction of a full
+1280 pass while small items (batteries) keep full-resolution recall.
+
+Usage:
+    cascade = Cascade(model, imgsz=(1280, 1280), coarse=640, roi=(0.1, 0.2, 0.9, 1.0))
+    det = cascade(im0)  # (n, 6) tensor [xyxy, conf, cls] in im0 pixels
+"""
+
+import math
+
+import numpy as np
+import torch
+import torchvision
+
+from utils.augmentations import letterbox
+from utils.general import non_max_suppression, scale_coords
+from utils.torch_utils import smart_inference_mode
+from preprocess import InputBuffer
+
+
+class Cascade:
+    """Detects in a region of interest at coarse size, refining low-confidence candidates on high-resolution tiles.
+
+    Coarse detections at or above conf_thres are kept as they are. Candidates between low_thres and conf_thres get a
+    square tile of the ROI at the resolution a full imgsz pass would have (larger for large boxes), tiles covering
+    several candidates are shared, and all tiles run as one batch at `tile` pixels. Tile detections cut by a tile edge
+    are dropped, the remaining ones replace the candidates and are merged with the confident coarse detections by NMS.
+    Frames with more than max_tiles tiles run the whole ROI at imgsz instead. Without a smaller coarse size only the
+    ROI crop applies. Batches of varying size need a PyTorch (or dynamic shape) model.
+    """
+
+    def __init__(self, model, imgsz=(1280, 1280), coarse=640, roi=None, conf_thres=0.25, low_thres=0.1,
+                 iou_thres=0.45, classes=None, agnostic=False, max_det=1000, tile=320, pad=0.5, max_tiles=8):
+        self.model = model
+        self.stride = int(model.stride)
+        self.imgsz = max(imgsz)  # full-resolution pass size
+        self.coarse = coarse
+        self.roi = roi  # x1, y1, x2, y2 in pixels, or fractions of the frame if all <= 1
+        self.conf_thres = conf_thres
+        self.low_thres = min(low_thres, conf_thres) if coarse < self.imgsz else conf_thres  # candidate threshold
+        self.iou_thres = iou_thres
+        self.classes = classes
+        self.agnostic = agnostic
+        self.max_det = max_det
+        self.tile = math.ceil(tile / self.stride) * self.stride
+        self.pad = pad  # tile margin around a candidate, fraction of its size
+        self.max_tiles = max_tiles
+        self.input_buffer = InputBuffer(model.device, model.fp16)
+        self.frames, self.refined, self.tiles, self.fallbacks = 0, 0, 0, 0
+
+    def region(self, shape):
+        # ROI of an image of shape (h, w, ...) in pixels, whole image without ROI
+        h, w = shape[:2]
+        if self.roi is None:
+            return 0, 0, w, h
+        x1, y1, x2, y2 = self.roi
+        if max(self.roi) <= 1:  # fractions
+            x1, y1, x2, y2 = x1 * w, y1 * h, x2 * w, y2 * h
+        return max(int(x1), 0), max(int(y1), 0), min(round(x2), w), min(round(y2), h)
+
+    def detect(self, ims, size, conf_thres):
+        # Detect a batch of BGR images at size x size, boxes in image pixels
+        x = np.stack([letterbox(im, size, stride=self.stride, auto=False)[0] for im in ims])
+        x = self.input_buffer(x[..., ::-1].transpose((0, 3, 1, 2)))  # BGR to RGB, BHWC to BCHW
+        pred = non_max_suppression(self.model(x), conf_thres, self.iou_thres, self.classes, self.agnostic,
+                                   max_det=self.max_det)
+        for im, det in zip(ims, pred):
+            det[:, :4] = scale_coords(x.shape[2:], det[:, :4], im.shape)
+        return pred
+
+    def windows(self, candidates, w, h):
+        # Tiles (x1, y1, x2, y2) in ROI pixels covering candidate boxes, highest confidence first
+        side = self.tile * max(w, h) / self.imgsz  # ROI pixels a tile covers at full-pass resolution
+        windows = []
+        for x1, y1, x2, y2 in candidates[:, :4].tolist():  # NMS output is sorted by confidence
+            if any(a <= x1 and b <= y1 and x2 <= c and y2 <= d for a, b, c, d in windows):
+                continue  # already inside a tile
+            s = max(side, (1 + 2 * self.pad) * max(x2 - x1, y2 - y1))
+            sw, sh = min(round(s), w), min(round(s), h)
+            a = min(max(round((x1 + x2 - sw) / 2), 0), w - sw)
+            b = min(max(round((y1 + y2 - sh) / 2), 0), h - sh)
+            windows.append((a, b, a + sw, b + sh))
+        return windows
+
+    @smart_inference_mode()
+    def __call__(self, im0):
+        x1, y1, x2, y2 = self.region(im0.shape)
+        roi = im0[y1:y2, x1:x2]
+        h, w = roi.shape[:2]
+        det = self.detect([roi], self.coarse, self.low_thres)[0]
+        self.frames += 1
+        low = det[:, 4] < self.conf_thres
+        if low.any():
+            self.refined += 1
+            windows = self.windows(det[low], w, h)
+            if len(windows) > self.max_tiles:  # crowded, one full-resolution pass is cheaper
+                self.fallbacks += 1
+                det = self.detect([roi], self.imgsz, self.conf_thres)[0]
+            else:
+                self.tiles += len(windows)
+                fine = self.detect([roi[b:d, a:c] for a, b, c, d in windows], self.tile, self.conf_thres)
+                kept, m = [det[~low]], 2  # confident coarse boxes; pixels, boxes this close to a tile edge are cut off
+                for (a, b, c, d), x in zip(windows, fine):
+                    x[:, :4] += torch.tensor((a, b, a, b), device=x.device, dtype=x.dtype)
+                    inside = ((x[:, 0] > a + m) | (a == 0)) & ((x[:, 1] > b + m) | (b == 0)) & \
+                             ((x[:, 2] < c - m) | (c == w)) & ((x[:, 3] < d - m) | (d == h))
+                    kept.append(x[inside])
+                det = torch.cat(kept)
+                groups = torch.zeros_like(det[:, 5]) if self.agnostic else det[:, 5]
+                det = det[torchvision.ops.batched_nms(det[:, :4], det[:, 4], groups.long(), self.iou_thres)]
+                det = det[:self.max_det]
+        det[:, :4] += torch.tensor((x1, y1, x1, y1), device=det.device, dtype=det.dtype)
+        return det
+
+    def __str__(self):
+        return f'{self.refined}/{self.frames} frames refined with {self.tiles} tiles, ' \
+               f'{self.fallbacks} full-resolution fallbacks'
@@ -26,19 +26,23 @@ Usage - formats:
 """
 
 import argparse
-import math
+import logging.handlers
 import os
 import platform
 import sys
+import threading
+import time
+from collections import deque
 from pathlib import Path
 from PyQt5 import QtCore, QtGui, QtWidgets, Qt
 from PyQt5.QtCore import QTimer, pyqtSignal, QRectF, QUrl, QRect, QDateTime, QDate
-from PyQt5.QtGui import QImage, QPixmap, QTransform, QPainter, QFont, QPalette, QBrush
+from PyQt5.QtGui import QImage, QPixmap, QTransform, QPainter, QFont, QPalette, QBrush, QTextCursor
 from PyQt5.QtMultimedia import QMediaPlayer, QVideoFrame, QAbstractVideoSurface, QAbstractVideoBuffer, QMediaContent
 from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QWidget, QHBoxLayout, QGridLayout, QLabel, \
     QSpacerItem, QSizePolicy, QVBoxLayout, QLineEdit, QTextEdit, QFrame, QPushButton, QProgressBar
 import sys
 import cv2
+import numpy as np
 import torch
 
 FILE = Path(__file__).resolve()
@@ -51,8 +55,22 @@ from models.common import DetectMultiBackend
 from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadScreenshots, LoadStreams
 from utils.general import (LOGGER, Profile, check_file, check_img_size, check_imshow, check_requirements, colorstr, cv2,
                            increment_path, non_max_suppression, print_args, scale_coords, strip_optimizer, xyxy2xywh)
-from utils.plots import Annotator, colors, save_one_box
+from utils.plots import colors
 from utils.torch_utils import select_device, smart_inference_mode
+from pipeline import DeadlineScheduler, Pipeline
+from motion import MotionGate
+from preprocess import InputBuffer
+from records import LabelTables, make_records
+from actuator import ActuatorSender
+from hsv import HSVClassifier, load_ranges
+from tracker import Sort
+from sinks import CropSink, LabelWriter, VideoSink, crop_views, labels_text
+from telemetry import Metrics, MetricsDump, MetricsServer, Profiler
+from detect_server import remote_run
+from multistream import StreamScheduler
+from cascade import Cascade
+from fast_nms import topk_nms
+from overlay import Overlay
 global mains
 global pointList
 class VideoSurface(QAbstractVideoSurface):
@@ -78,29 +96,31 @@ class VideoSurface(QAbstractVideoSurface):
 
 
 class VideoWidget(QWidget):
+    # 其他线程推送新帧后的通知信号，只在没有待显示帧时发送
+    frameReady = pyqtSignal()
+
     def __init__(self, parent=None):
         super(VideoWidget, self).__init__(parent)
         # 当前帧QImage
         self.__image = None
+        # 当前帧的numpy数据，QImage不持有数据需保留引用
+        self.__frame = None
+        # 其他线程推送、尚未显示的最新帧
+        self.__nextFrame = None
+        self.__lock = threading.Lock()
         # 旋转的度数
         self.__degree = 0
-        # 缩放后的宽度
-        self.__scaleWidth = None
-        # 缩放后的高度
-        self.__scaleHeight = None
-        # 缩放后的位置
-        self.__posX = 0
-        self.__posY = 0
         # 垂直翻转标志位
         self.__verticalFlipFlag = False
         # 水平翻转标志位
         self.__horizontalFlipFlag = False
+        # 缩放、旋转、翻转合成的变换，窗口大小、图片大小或设置变化时才重新计算
+        self.__transform = None
+        self.__imageSize = None
+        self.frameReady.connect(self.takeFrame)
 
     def resizeEvent(self, event):
-        self.calculateRectAfterResize()
-        if self.__degree in (-90, 90, -270, 270):
-            # 交换两个变量
-            self.__scaleWidth, self.__scaleHeight = self.__scaleHeight, self.__scaleWidth
+        self.__transform = None
         self.update()
         super(VideoWidget, self).resizeEvent(event)
 
@@ -108,96 +128,74 @@ class VideoWidget(QWidget):
         painter = QPainter()
         painter.begin(self)
         if self.__image:
-            rect = QRectF(self.__posX, self.__posY, self.__image.width(), self.__image.height())
-            painter.drawImage(rect, self.__image)
+            if self.__transform is None or self.__imageSize != self.__image.size():
+                self.calculateTransform()
+            # 绘制时一次完成缩放、旋转和翻转，不生成中间图像
+            painter.setTransform(self.__transform)
+            painter.drawImage(0, 0, self.__image)
         else:
             # 这里可以做视频加载动画
             pass
         painter.end()
 
-    def calculateRectAfterResize(self):
-        """调整大小后计算宽高和位置"""
-        if self.__image:
-            # 当前显示窗口宽高比
-            widgetRatio = self.width() / self.height()
-            srcRatio = self.__image.width() / self.__image.height()
-            if widgetRatio >= srcRatio:
-                self.__scaleWidth = srcRatio * self.height()
-                self.__scaleHeight = self.height()
-                self.__posX = (self.width() - self.__scaleWidth) / 2
-                self.__posY = 0
-            else:
-                self.__scaleWidth = self.width()
-                self.__scaleHeight = self.width() / srcRatio
-                self.__posX = 0
-                self.__posY = (self.height() - self.__scaleHeight) / 2
-
-    def calculateRectAfterTransform(self):
-        """setTransform后计算宽高和位置"""
-        if self.__image:
-            # 当前显示窗口宽高比
-            widgetRatio = self.width() / self.height()
-            srcRatio = self.__image.height() / self.__image.width()
-            if widgetRatio >= srcRatio:
-                self.__scaleWidth = self.height()
-                self.__scaleHeight = self.height() * srcRatio
-                self.__posX = (self.width() - self.__scaleHeight) / 2
-                self.__posY = 0
-            else:
-                self.__scaleWidth = self.width() / srcRatio
-                self.__scaleHeight = self.width()
-                self.__posX = 0
-                self.__posY = (self.height() - self.__scaleWidth) / 2
+    def calculateTransform(self):
+        """根据窗口大小、旋转角度和翻转标志计算合成变换，图片居中并保持宽高比"""
+        w, h = self.__image.width(), self.__image.height()
+        self.__imageSize = self.__image.size()
+        # 旋转90或270度时宽高互换
+        rotatedWidth, rotatedHeight = (h, w) if self.__degree % 180 else (w, h)
+        scale = min(self.width() / rotatedWidth, self.height() / rotatedHeight)
+        matrix = QTransform()
+        matrix.translate(self.width() / 2, self.height() / 2)
+        # 翻转在旋转之后的画面上进行
+        if self.__verticalFlipFlag:
+            matrix.scale(1, -1)
+        elif self.__horizontalFlipFlag:
+            matrix.scale(-1, 1)
+        matrix.rotate(self.__degree)
+        matrix.scale(scale, scale)
+        matrix.translate(-w / 2, -h / 2)
+        self.__transform = matrix
+
+    def pushFrame(self, im):
+        """可在任意线程调用，只保留最新帧，界面来不及显示的帧被合并丢弃"""
+        with self.__lock:
+            pending = self.__nextFrame is not None
+            self.__nextFrame = im
+        if not pending:
+            self.frameReady.emit()
+
+    def takeFrame(self):
+        """槽函数，在界面线程取出最新帧并显示"""
+        with self.__lock:
+            im, self.__nextFrame = self.__nextFrame, None
+        if im is not None:
+            self.showFrameSlot(im)
+
+    def showFrameSlot(self, im):
+        """槽函数，接收BGR numpy帧，直接包装为QImage而不拷贝"""
+        im = np.ascontiguousarray(im)
+        # QImage不持有数据，保留numpy帧的引用直到下一帧
+        self.__frame = im
+        self.showImageSlot(QImage(im.data, im.shape[1], im.shape[0], im.strides[0], QImage.Format_BGR888))
 
     def showImageSlot(self, img):
-        """槽函数，接收图片，进行缩放和变换"""
-        if self.__image is None:
-            # 如果是初次接收图片，需要根据当前窗口大小计算宽高和位置
-            self.__image = img
-            self.calculateRectAfterResize()
-            if self.__degree in (-90, 90, -270, 270):
-                # 交换两个变量
-                self.__scaleWidth, self.__scaleHeight = self.__scaleHeight, self.__scaleWidth
+        """槽函数，接收图片，变换在绘制时进行"""
         self.__image = img
-        # 缩放
-        self.doScale()
-        # 旋转
-        self.doRotate()
-        # 翻转
-        self.doFlip()
+        # 多次update在下一次绘制前会被Qt合并
         self.update()
 
-    def doScale(self):
-        """进行缩放操作"""
-        if self.__scaleWidth and self.__scaleHeight:
-            self.__image = self.__image.scaled(self.__scaleWidth, self.__scaleHeight)
-
-    def doRotate(self):
-        """进行旋转操作"""
-        if self.__degree != 0:
-            matrix = QTransform()
-            matrix.rotate(self.__degree)
-            self.__image = self.__image.transformed(matrix, Qt.FastTransformation)
-
-    def doFlip(self):
-        """进行翻转操作"""
-        if self.__verticalFlipFlag:
-            # 垂直翻转
-            self.__image = self.__image.mirrored()
-        elif self.__horizontalFlipFlag:
-            # 水平翻转
-            self.__image = self.__image.mirrored(True, False)
-
     def setFlip(self, direction):
         if direction == horizontalFlip:
             # 如果是水平垂直翻转，对应的标志位取反
             self.__horizontalFlipFlag = not self.__horizontalFlipFlag
         elif direction == verticalFlip:
             self.__verticalFlipFlag = not self.__verticalFlipFlag
+        self.__transform = None
         self.update()
 
     def setRotate(self, direction):
-        """设置旋转角度并计算一些值"""
+        """设置旋转角度"""
         if direction == rotateToLeft:
             # 如果是左右旋转，需要修改度数
             self.__degree -= 90
@@ -206,9 +204,7 @@ class VideoWidget(QWidget):
         # 如果旋转度数达到了+-360，归零
         if self.__degree == 360 or self.__degree == -360:
             self.__degree = 0
-        self.calculateRectAfterTransform()
-        if self.__degree in (0, -180, 180):
-            self.__scaleWidth, self.__scaleHeight = self.__scaleHeight, self.__scaleWidth
+        self.__transform = None
         self.update()
 
 
@@ -218,6 +214,35 @@ rotateToLeft = 0
 rotateToRight = 1
 
 
+class DetectThread(QtCore.QThread):
+    # 标注后的BGR帧(numpy)，跨线程只传引用
+    frameSignal = pyqtSignal(object)
+    # 当前帧的检测记录(records.RECORD结构化数组)
+    recordsSignal = pyqtSignal(object)
+
+    def __init__(self, opt, parent=None):
+        super(DetectThread, self).__init__(parent)
+        self.opt = opt
+        self.__running = True
+
+    def run(self):
+        """线程函数，运行检测，每帧结果以信号发送给界面"""
+        if not self.opt.server:
+            check_requirements(exclude=('tensorboard', 'thop'))
+        run(**vars(self.opt), callback=self.emitResult)
+
+    def emitResult(self, im0, records):
+        self.frameSignal.emit(im0)
+        self.recordsSignal.emit(records)
+        # 返回False时检测循环退出
+        return self.__running
+
+    def stop(self):
+        """停止检测并等待线程结束"""
+        self.__running = False
+        self.wait()
+
+
 class Ui_Form(object):
 
     def setupUi(self, Form):
@@ -248,43 +273,131 @@ class Ui_Form(object):
         self.label.setText("hello world!!!")
 
 
+class RubbishTally(QtCore.QObject):
+    # 某一类垃圾数量改变时发送，参数为类别下标
+    changed = pyqtSignal(int)
+    # 类别名称，下标即类别编号
+    names = ["可回收垃圾", "有害垃圾", "厨余垃圾", "其它垃圾"]
+
+    def __init__(self, parent=None):
+        super(RubbishTally, self).__init__(parent)
+        self.__counts = [0] * len(self.names)
+
+    def __getitem__(self, index):
+        return self.__counts[index]
+
+    def __setitem__(self, index, value):
+        """设置某类数量，数值变化时才发送通知"""
+        if self.__counts[index] != value:
+            self.__counts[index] = value
+            self.changed.emit(index)
+
+    def __len__(self):
+        return len(self.__counts)
+
+    def total(self):
+        return sum(self.__counts)
+
+
+class EventLog:
+    """详情面板的物品记录：内存中只保留最近maxEntries条，界面每个刷新周期最多更新一次文档，
+    被挤出的旧记录可写入按大小轮转的日志文件"""
+
+    def __init__(self, textEdit, maxEntries=200, headerLines=4, logFile=None, interval=100):
+        self.textEdit = textEdit
+        self.entries = deque(maxlen=maxEntries)
+        # 等待写入文档的记录
+        self.pending = []
+        # 文档中已显示的记录条数，表头之后每条记录占一行
+        self.shown = 0
+        self.headerLines = headerLines
+        self.interval = interval
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+        self.spill = None
+        if logFile:
+            self.spill = logging.getLogger(f'eventlog.{logFile}')
+            self.spill.propagate = False
+            self.spill.setLevel(logging.INFO)
+            # 每个文件1MB，保留5个旧文件
+            handler = logging.handlers.RotatingFileHandler(logFile, maxBytes=1 << 20, backupCount=5,
+                                                           encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.spill.addHandler(handler)
+
+    def append(self, text):
+        """添加一条记录(以换行结尾)，在下一个刷新周期显示"""
+        if self.spill and len(self.entries) == self.entries.maxlen:
+            self.spill.info(self.entries[0].rstrip('\n'))
+        self.entries.append(text)
+        self.pending.append(text)
+        if not self.timer.isActive():
+            self.timer.start(self.interval)
+
+    def flush(self):
+        """一次性把等待的记录追加到文档末尾，并删除超出上限的最旧记录"""
+        maxEntries = self.entries.maxlen
+        pending, self.pending = self.pending[-maxEntries:], []
+        cursor = QTextCursor(self.textEdit.document())
+        cursor.beginEditBlock()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(''.join(pending))
+        self.shown += len(pending)
+        excess = self.shown - maxEntries
+        if excess > 0:
+            cursor.movePosition(QTextCursor.Start)
+            cursor.movePosition(QTextCursor.NextBlock, QTextCursor.MoveAnchor, self.headerLines)
+            cursor.movePosition(QTextCursor.NextBlock, QTextCursor.KeepAnchor, excess)
+            cursor.removeSelectedText()
+            self.shown = maxEntries
+        cursor.endEditBlock()
+
+
 class mainwindow:
-    def __init__(self):
-        self.sumOfRubbishs = [0, 0, 0, 0]
+    # 统计标签两次刷新之间的最小间隔(ms)
+    refreshInterval = 40
+
+    def __init__(self, maxEvents=200, eventLogFile=None):
+        # 详情面板保留的记录条数，及旧记录写入的日志文件(None为不保存)
+        self.maxEvents = maxEvents
+        self.eventLogFile = eventLogFile
+        self.tally = RubbishTally()
         self.sumOfRubbish = 0
-
-    def getNum(self,label,isFull=False):
-        label,percent=self.cuts(label)
-        if label=="battery":
-            self.sumOfRubbishs[1]=percent
-            print(self.sumOfRubbishs)
-        if label=="can" or label=="bottle":
-            self.sumOfRubbishs[0]=percent
-        if label=="red_carrot" or label=="white_carrot" or label=="potato":
-            self.sumOfRubbishs[2]=percent
+        # 已计数的(视频流, 跟踪编号)
+        self.countedTracks = set()
+        # 等待刷新的类别下标
+        self.dirtyLabels = set()
+
+    def showDetections(self, records):
+        """槽函数，接收检测线程的检测记录，已确认的跟踪目标每个只计一次"""
+        for stream, track, category in records[records['number'] > 0][['stream', 'track', 'category']].tolist():
+            if (stream, track) not in self.countedTracks:
+                self.countedTracks.add((stream, track))
+                self.getNum(category)
+
+    def getNum(self,category,isFull=False):
+        """类别category(records.CATEGORIES下标)的垃圾数量加一，并记入详情面板"""
+        self.tally[category]+=1
         Time = QDateTime.currentDateTime()  # 获取现在的时间
         Timeplay = Time.toString('hh:mm:ss')  # 设置显示时间的格式
-        if label== "can" or label== "bottle":
-            self.textStream.insertText("可回收垃圾×1\t" + Timeplay + "\n")
-        if label=="battery":
-            self.textStream.insertText("有害垃圾×1\t" + Timeplay + "\n")
-        if label=="red_carrot" or label=="white_carrot" or label=="potato":
-            self.textStream.insertText("厨余垃圾×1\t" + Timeplay + "\n")
+        self.eventLog.append(RubbishTally.names[category] + "×1\t" + Timeplay + "\n")
+    def labelText(self, index):
+        return RubbishTally.names[index] + ("：" if index == 0 else "：  ") + str(self.tally[index])
+
+    def markDirty(self, index):
+        """槽函数，记录变化的类别，一个刷新间隔内的多次变化合并为一次刷新"""
+        self.dirtyLabels.add(index)
+        if not self.refreshTimer.isActive():
+            self.refreshTimer.start(self.refreshInterval)
+
     def showLabels(self):
-        print(self.sumOfRubbishs)
-        style = QFont()
-        style.setPointSize(16)
-        self.showResName.setText("可回收垃圾：" + str(self.sumOfRubbishs[0]))
-        self.showResName.setFont(style)
-        self.showUnResName.setText("有害垃圾：  " + str(self.sumOfRubbishs[1]))
-        self.showUnResName.setFont(style)
-        self.showFoodName.setText("厨余垃圾：  " + str(self.sumOfRubbishs[2]))
-        self.showFoodName.setFont(style)
-        self.showOtherName.setText("其它垃圾：  " + str(self.sumOfRubbishs[3]))
-        self.showOtherName.setFont(style)
-        self.sumOfRubbish=self.sumOfRubbishs[0]+self.sumOfRubbishs[1]+self.sumOfRubbishs[2]+self.sumOfRubbishs[3]
+        """只刷新数量变化过的标签"""
+        for index in self.dirtyLabels:
+            self.categoryLabels[index].setText(self.labelText(index))
+        self.dirtyLabels.clear()
+        self.sumOfRubbish = self.tally.total()
         self.showRubbishSum.setText("垃圾总数：  " + str(self.sumOfRubbish) + "(" + self.stringIsFull + ")")
-        self.showRubbishSum.setFont(style)
         self.showProcesser.setValue(int(self.sumOfRubbish / 2))
     def start(self):
         app = QApplication(sys.argv)
@@ -310,8 +423,6 @@ class mainwindow:
         mainLayout.addWidget(showVideo, 1, 1)
 
         videoSurface.showImageSignal.connect(showVideo.showImageSlot)
-        player.setMedia(QMediaContent(QUrl.fromLocalFile(r'C:\Users\dell\Desktop\video1.avi')))
-        player.play()
 
         showTimeDetailBack = QGridLayout()
         showTimeDetail = QWidget()
@@ -337,14 +448,15 @@ class mainwindow:
         self.showUnResName = QLabel()
         self.showFoodName = QLabel()
         self.showOtherName = QLabel()
-        self.showResName.setText("可回收垃圾：" + str(self.sumOfRubbishs[0]))
-        self.showResName.setFont(style)
-        self.showUnResName.setText("有害垃圾：  " + str(self.sumOfRubbishs[1]))
-        self.showUnResName.setFont(style)
-        self.showFoodName.setText("厨余垃圾：  " + str(self.sumOfRubbishs[2]))
-        self.showFoodName.setFont(style)
-        self.showOtherName.setText("其它垃圾：  " + str(self.sumOfRubbishs[3]))
-        self.showOtherName.setFont(style)
+        self.categoryLabels = [self.showResName, self.showUnResName, self.showFoodName, self.showOtherName]
+        for index, label in enumerate(self.categoryLabels):
+            label.setText(self.labelText(index))
+            label.setFont(style)
+        # 数量变化时才刷新标签，字体只设置一次
+        self.refreshTimer = QTimer()
+        self.refreshTimer.setSingleShot(True)
+        self.refreshTimer.timeout.connect(self.showLabels)
+        self.tally.changed.connect(self.markDirty)
         showSecondBackground.addWidget(self.showResName, 1, 1, 1, 1)
         showSecondBackground.addWidget(self.showUnResName, 1, 2, 1, 1)
         showSecondBackground.addWidget(self.showFoodName, 2, 1, 1, 1)
@@ -392,6 +504,7 @@ class mainwindow:
         Time = QDateTime.currentDateTime()  # 获取现在的时间
         for i in range(4):
             self.textStream.insertText(textString[i])
+        self.eventLog = EventLog(self.showDetail, self.maxEvents, len(textString), self.eventLogFile)
         self.showProcesser.setFixedSize(480,25)
         self.showProcesser.setStyleSheet("QProgressBar { border: 2px solid grey; border-radius: 5px; background-color: #FFFFFF; text-align: center;}QProgressBar::chunk {background:QLinearGradient(x1:0,y1:0,x2:2,y2:0,stop:0 #666699,stop:1  #DB7093); }")
         font = QFont()
@@ -423,65 +536,47 @@ class mainwindow:
 
         MainWindow.show()
         opt = parse_opt()
-        main(opt)
+        # 检测在子线程中运行，不阻塞事件循环
+        opt.track = True
+        self.detector = DetectThread(opt)
+        # 帧在检测线程中直接交给控件，由控件合并后送到界面线程
+        self.detector.frameSignal.connect(showVideo.pushFrame, QtCore.Qt.DirectConnection)
+        self.detector.recordsSignal.connect(self.showDetections)
+        app.aboutToQuit.connect(self.detector.stop)
+        self.detector.start()
         sys.exit(app.exec_())
 
     def statusShowTime(self):
         self.Timer = QTimer()  # 自定义QTimer类
+        self.Timer.setSingleShot(True)
         self.Timer.timeout.connect(self.updateTime)  # 与updateTime函数连接
-        self.Timer.start(100)  # 每0.1s运行一次
+        self.updateTime()
 
     def updateTime(self):
         time = QDateTime.currentDateTime()  # 获取现在的时间
         timeplay = time.toString('hh:mm:ss')  # 设置显示时间的格式
-        self.showLabels()
         self.timeLabel.setText(timeplay)  # 设置timeLabel控件显示的内容
-    def cuts(self,label):
-        paralist=label.split(" ")
-        cnt=0
-        name=""
-        percent=0.0
-        for i in paralist:
-            if cnt==0:
-                cnt=1
-                name=i
-            else:
-                percent=int(i)
-        return name,percent
+        # 在下一个整秒再运行，每秒只刷新一次
+        self.Timer.start(1000 - time.time().msec())
 class RubbishClass:
     name=""
     percent=0.0
-    def __init__(self,label):
-        self.name,self.percent=self.cuts(label)
+    def __init__(self,record,names):
+        """record为records.RECORD中的一条检测记录，names为类别名称表"""
+        self.name=names[record['cls']]
+        self.percent=float(record['conf'])
+        self.code=int(record['code'])
         print("NAME:"+self.name+" "+"PERCENT:"+str(self.percent))
         print("TRANSFER:"+str(self.transfer()))
-    def cuts(self,label):
-        paralist=label.split(" ")
-        cnt=0
-        name=""
-        percent=0.0
-        for i in paralist:
-            if cnt==0:
-                cnt=1
-                name=i
-            else:
-                percent=float(i)
-        return name,percent
     def transfer(self):
-        if self.name=="battery":
-            return 0x00
-        if self.name=="bottle":
-            return 0x01
-        if self.name=="potato":
-            return 0x02
-        if self.name=="carrot":
-            return 0x03
-        return 0x04
+        # 分拣执行机构的指令码，由records.LabelTables按类别查表得到
+        return self.code
 class shit:
     def __init__(self):
         self.pl=[]
     def set(self,pi):
         self.pl=pi
+pointList=shit()
 @smart_inference_mode()
 def run(
         weights=ROOT / 'yolov5s.pt',  # model path or triton URL
@@ -511,7 +606,47 @@ def run(
         half=False,  # use FP16 half-precision inference
         dnn=False,  # use OpenCV DNN for ONNX inference
         vid_stride=1,  # video frame-rate stride
+        batch_size=1,  # frames per inference batch for file/video/directory sources
+        channels_last=False,  # use channels-last (NHWC) input memory layout
+        latency_budget=0,  # real-time mode: skip frames that cannot be processed within this many ms, 0 to disable
+        motion_thres=0.0,  # changed-pixel fraction that triggers inference, 0 to run inference on every frame
+        track=False,  # track objects across frames, count each one once
+        detect_interval=1,  # run detection every N frames, tracker predicts boxes in between (implies --track)
+        pipeline=False,  # run capture, inference, NMS and sink as concurrent stages
+        pipeline_depth=4,  # max batches queued between pipeline stages
+        pipeline_policy='block',  # pipeline backpressure policy: block or drop (oldest frame)
+        actuator=None,  # sorting actuator port, i.e. /dev/ttyUSB0 or socket://host:port, sends each object once
+        actuator_baud=9600,  # actuator serial baud rate
+        hsv_ranges=None,  # HSV ranges yaml, confirm/relabel look-alike classes by box colour
+        timings=None,  # list receiving a dict of stage times (s) per batch, i.e. for detect_benchmark.py
+        metrics_port=0,  # serve stage metrics on http://127.0.0.1:port/metrics, 0 to disable
+        metrics_file=None,  # dump stage metrics as JSON to this file every metrics_interval seconds
+        metrics_interval=10.0,  # metrics file dump interval (s)
+        profile=None,  # profile frames with 'torch' (torch.profiler trace) or 'cprofile', saved to save_dir
+        profile_frames=100,  # frames to profile, after the first 10
+        model=None,  # loaded and warmed up DetectMultiBackend to use instead of weights, i.e. from detect_server.py
+        server=None,  # detect_server.py socket, run this job on the server's warm model
+        multistream=False,  # batch whichever streams have new frames instead of all streams in lockstep
+        stream_fps=None,  # per-stream fps caps with --multistream, one value for all or one per stream, 0 uncapped
+        frame_range=None,  # (start, end) frames of a single video source to process, i.e. a shard.py shard
+        roi=None,  # region of interest x1 y1 x2 y2 (pixels, or fractions of the frame), i.e. the bin opening
+        cascade_imgsz=0,  # coarse pass size, refine low-confidence candidates at imgsz on tiles, 0 to disable
+        cascade_thres=0.1,  # coarse pass confidence threshold of candidates to refine
+        nms_topk=0,  # few-class NMS keeping the top k candidates per class, 0 for non_max_suppression
+        crops=None,  # CropSink to fill instead of --save-crop's own, i.e. to read its latest() crops elsewhere
+        callback=None,  # callback(im0, records) per annotated image, i.e. for the GUI, return False to stop
 ):
+    # torch.profiler and cProfile only record the thread that starts them, stage threads would be missing
+    assert not (profile and pipeline), '--profile records the calling thread only, profile without --pipeline'
+    if server:  # thin client, results and callbacks come back over the socket
+        options = dict(locals())
+        exclude = 'weights', 'data', 'device', 'half', 'dnn', 'model', 'server', 'callback', 'timings', 'crops'
+        options = {k: str(v) if isinstance(v, Path) else v for k, v in options.items() if k not in exclude}
+        for k in 'source', 'project', 'hsv_ranges', 'metrics_file':  # local paths, the server has its own cwd
+            x = options[k]
+            if x and not (str(x).isnumeric() or '://' in str(x) or str(x).lower().startswith('screen')):
+                options[k] = os.path.abspath(x)
+        return remote_run(server, callback, **options)
     source = str(source)
     save_img = not nosave and not source.endswith('.txt')  # save inference images
     is_file = Path(source).suffix[1:] in (IMG_FORMATS + VID_FORMATS)
@@ -526,149 +661,423 @@ def run(
     (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
 
     # Load model
-    device = select_device(device)
-    model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+    warm = model is not None  # preloaded by detect_server.py
+    if not warm:
+        device = select_device(device)
+        model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
     stride, names, pt = model.stride, model.names, model.pt
+    tables = LabelTables(names)  # class id: category, actuator code
+    classifier = HSVClassifier(load_ranges(hsv_ranges), names) if hsv_ranges else None  # second-stage classifier
     imgsz = check_img_size(imgsz, s=stride)  # check image size
+    cascade = Cascade(model, imgsz, check_img_size(cascade_imgsz or max(imgsz), s=stride), roi, conf_thres,
+                      cascade_thres, iou_thres, classes, agnostic_nms, max_det) if cascade_imgsz or roi else None
+    loader_size = [int(stride)] * 2 if cascade else imgsz  # the cascade letterboxes im0s itself, im only sets shapes
+    if cascade and batch_size > 1:
+        LOGGER.warning(f'WARNING ⚠️ --batch-size {batch_size} ignored, the cascade runs one frame at a time')
+        batch_size = 1
 
     # Dataloader
-    if webcam:
+    if webcam and multistream:
         view_img = check_imshow()
-        dataset = LoadStreams(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
+        dataset = StreamScheduler(source, img_size=loader_size, stride=stride, fps=stream_fps,
+                                  max_batch=batch_size if batch_size > 1 else 0, vid_stride=vid_stride)
+    elif webcam:
+        view_img = check_imshow()
+        dataset = LoadStreams(source, img_size=loader_size, stride=stride, auto=pt, vid_stride=vid_stride)
     elif screenshot:
-        dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
+        dataset = LoadScreenshots(source, img_size=loader_size, stride=stride, auto=pt)
     else:
-        dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
-    bs = len(dataset)  # batch_size
+        dataset = LoadImages(source, img_size=loader_size, stride=stride, auto=pt, vid_stride=vid_stride)
+        if frame_range:  # seek, frame numbers (and label file names) stay those of the whole video
+            dataset.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_range[0] * vid_stride)
+            dataset.frame = frame_range[0]
+    view_img = view_img and callback is None  # the GUI displays frames itself
+    annotate = save_img or view_img or callback is not None  # a sink needs the annotated frame
+    overlay = Overlay(line_thickness)  # label sprites cached across frames
+    repeats = webcam and not multistream  # LoadStreams may return the same frame array again
+    bs = len(dataset) if webcam else 1 if screenshot else max(batch_size, 1)  # batch_size
     vid_path, vid_writer = [None] * bs, [None] * bs
 
     # Run inference
-    model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
+    if not warm:
+        model.warmup(imgsz=(1 if (pt or model.triton) and webcam else bs, 3, *imgsz))  # warmup
     seen, windows, dt = 0, [], (Profile(), Profile(), Profile())
-    for path, im, im0s, vid_cap, s in dataset:
+    detections = {}  # class name: detections
+    label_writer = LabelWriter() if save_txt else None
+    scheduler = DeadlineScheduler(latency_budget / 1E3) if latency_budget else None  # real-time mode
+    gate, last_pred = MotionGate(motion_thres) if motion_thres else None, {}  # change detection, stream: NMS output
+    trackers = {} if track or detect_interval > 1 or actuator else None  # stream: Sort
+    sender, actuated = ActuatorSender(actuator, actuator_baud) if actuator else None, set()  # (stream, track) sent
+    metrics = Metrics()  # named stage timers, gauges and rates
+    metrics_server = MetricsServer(metrics, metrics_port) if metrics_port else None
+    dump = MetricsDump(metrics, metrics_file, metrics_interval) if metrics_file else None
+    profiler = Profiler(profile, save_dir, profile_frames) if profile else None
+    crop_sink = crops or (CropSink(save_dir / 'crops', drop=webcam) if save_crop else None)
+    if label_writer:
+        metrics.gauge('label_queue', label_writer.queue.qsize)
+    if crop_sink:
+        metrics.gauge('crop_queue', crop_sink.queue.qsize)
+    if sender:
+        metrics.gauge('actuator_queue', sender.queue.qsize)
+    since_detect = {}  # stream: batches since its last detection, for --detect-interval
+    stopped = False  # set when callback returns False
+    if channels_last and pt:
+        model.model.to(memory_format=torch.channels_last)
+    # Pipelined batches stay in use until inference finishes: one filled, up to pipeline_depth queued, one running.
+    # That bound only holds while the source waits for space, under 'drop' it runs ahead and would overwrite a queued
+    # tensor still to be read, so the inference stage fills its own single buffer instead
+    fill_late = pipeline and pipeline_policy == 'drop'
+    input_buffer = InputBuffer(model.device, model.fp16, channels_last,
+                               n=pipeline_depth + 2 if pipeline and not fill_late else 1)
+
+    def collate(items):
+        # Stack same-shape file frames into one batch, keeping per-frame metadata as tuples
+        path, im, im0s, vid_info, s, frame, mode, t = zip(*items)
+        return dict(path=path, im=np.stack(im), im0s=im0s, vid_info=vid_info, s=s, frame=frame, mode=mode, t0=t[0],
+                    t_capture=t, stream=(0,) * len(items))
+
+    def read():
+        # Iterate the dataloader, timing each read
+        it = iter(dataset)
+        while True:
+            with metrics.time('capture'):
+                x = next(it, None)
+            if x is None:
+                return
+            yield x
+
+    def capture():
+        # Read frames and their metadata while it is current, grouping up to bs file frames per batch
+        if multistream and webcam:  # StreamScheduler batches ready streams itself
+            yield from dataset
+            return
+        items, t_video = [], None
+        for path, im, im0s, vid_cap, s in read():
+            t = time.time()  # capture time
+            if webcam:  # LoadStreams already batches all streams
+                n = len(path)
+                yield dict(path=path, im=im, im0s=im0s, vid_info=(None,) * n, s=tuple(f'{i}: ' for i in range(n)),
+                           frame=(dataset.count,) * n, mode=(dataset.mode,) * n, t0=t, t_capture=(t,) * n,
+                           stream=tuple(range(n)))
+                continue
+            vid_info, frame = None, getattr(dataset, 'frame', 0)
+            if frame_range and frame > frame_range[1]:
+                break
+            if vid_cap:  # video, read writer properties before the capture can be released by the dataloader
+                vid_info = (vid_cap.get(cv2.CAP_PROP_FPS), int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                            int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                if scheduler:  # replay video files in real time, as if each frame arrived from a camera
+                    t_video = t if frame == 1 or t_video is None else t_video
+                    t = t_video + (frame - 1) * vid_stride / (vid_info[0] or 30)
+                    time.sleep(max(t - time.time(), 0))  # wait for the frame to 'arrive'
+                    if not scheduler.admit(t):
+                        continue
+            if items and im.shape != items[-1][1].shape:  # letterbox shape changed, flush
+                yield collate(items)
+                items = []
+            items.append((path, im, im0s, vid_info, s, frame, dataset.mode, t))
+            if len(items) == bs:
+                yield collate(items)
+                items = []
+        if items:
+            yield collate(items)
+
+    def preprocess(batch):
         with dt[0]:
-            im = torch.from_numpy(im).to(model.device)
-            im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
-            im /= 255  # 0 - 255 to 0.0 - 1.0
-            if len(im.shape) == 3:
-                im = im[None]  # expand for batch dim
-
-        # Inference
+            if not cascade and not fill_late:  # the cascade prepares its own inputs from im0s
+                batch['im'] = input_buffer(batch['im'])  # uint8 to normalized fp16/32 in a reused tensor
+        batch['times'] = dict(n=len(batch['path']), preprocess=dt[0].dt)
+        return batch
+
+    def inference(batch):
+        if scheduler and not scheduler.admit(batch['t0']):
+            return None  # too late to meet the latency budget, skip
+        if gate and not gate.check(batch['stream'], batch['im0s']):
+            batch['reuse'], batch['t'] = True, 0.0  # static scene, postprocess reuses the last detections
+            return batch
+        if detect_interval > 1:  # per stream, multistream batches hold whichever streams are ready
+            if all(since_detect.get(k, detect_interval) < detect_interval for k in batch['stream']):
+                for k in batch['stream']:
+                    since_detect[k] += 1
+                batch['track_only'], batch['t'] = True, 0.0  # boxes predicted by the trackers
+                return batch
+            since_detect.update((k, 1) for k in batch['stream'])  # detect when any stream in the batch is due
+        if fill_late and not cascade:  # frames dropped while queued never reach a buffer
+            t = time.time()
+            batch['im'] = input_buffer(batch['im'])
+            batch['times']['preprocess'] += time.time() - t
         with dt[1]:
-            visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
-            pred = model(im, augment=augment, visualize=visualize)
-
+            if cascade:  # coarse-to-fine, NMS included, boxes in im0 pixels
+                batch['pred'] = [cascade(im0) for im0 in batch['im0s']]
+            else:
+                vis = increment_path(save_dir / Path(batch['path'][0]).stem, mkdir=True) if visualize else False
+                batch['pred'] = model(batch['im'], augment=augment, visualize=vis)
+        batch['t'] = dt[1].dt  # inference time of this batch
+        return batch
+
+    def postprocess(batch):
+        t, times = time.time(), batch['times']
+        times['inference'], times['nms'] = batch['t'], 0.0
         # NMS
-        with dt[2]:
-            pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
-        # Second-stage classifier (optional)
+        if batch.get('reuse'):
+            pred = [last_pred[k].clone() for k in batch['stream']]
+        elif batch.get('track_only'):
+            pred = [None] * len(batch['path'])  # boxes come from the trackers
+        else:
+            if cascade:  # NMS ran inside the cascade, boxes already in im0 pixels
+                pred = batch['pred']
+            else:
+                with dt[2]:
+                    if nms_topk:
+                        pred = topk_nms(batch['pred'], conf_thres, iou_thres, classes, agnostic_nms, max_det,
+                                        nms_topk)
+                    else:
+                        pred = non_max_suppression(batch['pred'], conf_thres, iou_thres, classes, agnostic_nms,
+                                                   max_det=max_det)
+                times['nms'] = dt[2].dt
+            if gate:  # kept before rescaling, reuse goes through the same path
+                last_pred.update((k, det.clone()) for k, det in zip(batch['stream'], pred))
+        # Second-stage classifier (optional), HSV ranges run per image below once boxes are in im0 pixels
         # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
 
         # Process predictions
+        nonlocal seen
+        im, results = batch['im'], []
         for i, det in enumerate(pred):  # per image
             seen += 1
-            if webcam:  # batch_size >= 1
-                p, im0, frame = path[i], im0s[i].copy(), dataset.count
-                s += f'{i}: '
-            else:
-                p, im0, frame = path, im0s.copy(), getattr(dataset, 'frame', 0)
+            p, im0, frame, s = batch['path'][i], batch['im0s'][i], batch['frame'][i], batch['s'][i]
+            if annotate and repeats:  # annotated in place, except frames a dataloader may return again
+                im0 = im0.copy()
+            stream = batch['stream'][i]  # tracker, writer and gate key
 
             p = Path(p)  # to Path
             save_path = str(save_dir / p.name)  # im.jpg
-            txt_path = str(save_dir / 'labels' / p.stem) + ('' if dataset.mode == 'image' else f'_{frame}')  # im.txt
-            s += '%gx%g ' % im.shape[2:]  # print string
+            txt_path = str(save_dir / 'labels' / p.stem) + ('' if batch['mode'][i] == 'image' else f'_{frame}')
+            s += '%gx%g ' % ((cascade.coarse,) * 2 if cascade else im.shape[2:])  # print string
             gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-            imc = im0.copy() if save_crop else im0  # for save_crop
-            annotator = Annotator(im0, line_width=line_thickness, example=str(names))
+            ids, numbers = None, None  # track ids and per-class count numbers, 0 for unconfirmed tracks
+            crop = None  # most confident detection crop, for --view-img
+            if det is None:  # detection skipped, tracker prediction in im0 pixels
+                with metrics.time('track'):
+                    det, ids, numbers = trackers.setdefault(stream, Sort()).predict()
+                det = torch.from_numpy(det)
+            else:
+                if len(det):
+                    if not cascade:  # rescale boxes from img_size to im0 size
+                        det[:, :4] = scale_coords(im.shape[2:], det[:, :4], im0.shape)
+                    det[:, :4] = det[:, :4].round()
+                    if classifier:  # colour check on the unannotated frame
+                        with metrics.time('classify'):
+                            cls, keep = classifier(im0, det[:, :4].cpu().numpy(), det[:, 5].cpu().numpy())
+                        det[:, 5] = torch.from_numpy(cls).to(det)
+                        det = det[torch.from_numpy(keep).to(det.device)]
+                if trackers is not None:
+                    with metrics.time('track'):
+                        det, ids, numbers = trackers.setdefault(stream, Sort()).update(det.cpu().numpy())
+                    det = torch.from_numpy(det)
             if len(det):
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_coords(im.shape[2:], det[:, :4], im0.shape).round()
-
                 # Print results
                 for c in det[:, 5].unique():
                     n = (det[:, 5] == c).sum()  # detections per class
                     print(n)
                     s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+                    detections[names[int(c)]] = detections.get(names[int(c)], 0) + int(n)
 
                 # Write results
-                count=1
-                for *xyxy, conf, cls in reversed(det):
-                    xywh1 = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-
-                    pointList.pl=xywh1
-                    if save_txt:  # Write to file
-                        xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-
-                        line = (cls, *xywh, conf) if save_conf else (cls, *xywh)  # label format
-                        with open(f'{txt_path}.txt', 'a') as f:
-                            f.write(('%g ' * len(line)).rstrip() % line + '\n')
-
-                    if save_img or save_crop or view_img:  # Add bbox to image
-                        c = int(cls)  # integer class
-                        label = None if hide_labels else (names[c] if hide_conf else f'{names[c]} {count:.0f}')
-                        count+=1
-
-                        #RubbishClass(label)
-                        #mains.getNum(label,True)
-                        #mains.stringIsFull="已满载"
-
-                        annotator.box_label(xyxy, label, color=colors(c, True))
-                    if save_crop:
-                        save_one_box(xyxy, imc, file=save_dir / 'crops' / names[c] / f'{p.stem}.jpg', BGR=True)
-
+                rdet = det.flip(0).cpu()  # reversed(det)
+                xywhn = xyxy2xywh(rdet[:, :4]) / gn  # normalized xywh, all boxes at once
+                pointList.pl = xywhn[-1].tolist()
+                if save_txt:  # Write to file
+                    line = (rdet[:, 5:], xywhn, rdet[:, 4:5]) if save_conf else (rdet[:, 5:], xywhn)  # label format
+                    label_writer.write(f'{txt_path}.txt', labels_text(torch.cat(line, 1).numpy()))
+
+                if crop_sink or view_img:  # before annotation, crops come from the clean frame
+                    with metrics.time('crop'):
+                        views = crop_views(im0, rdet[:, :4].numpy())  # real frame size, crop_sink copies them
+                        if view_img:  # most confident, rdet is reversed, copied before the frame is drawn on
+                            crop = views[-1].copy()
+                        if crop_sink:
+                            stem = p.stem if batch['mode'][i] == 'image' else f'{p.stem}_{frame}'
+                            rids = [0] * len(rdet) if ids is None else ids[::-1].tolist()
+                            for k, (x, (*_, conf, cls), track) in enumerate(zip(views, rdet.tolist(), rids)):
+                                crop_sink.put(x, f'{names[int(cls)]}/{stem}_{k}.jpg', int(cls), conf, track, stream,
+                                              frame)
+
+                rnumbers = None if numbers is None else numbers[::-1].tolist()
+                if annotate:  # Add bboxes to image
+                    with metrics.time('annotate'):
+                        labels, box_colors = [], []
+                        for k, c in enumerate(rdet[:, 5].int().tolist()):
+                            n = k + 1 if rnumbers is None else rnumbers[k]  # per-frame index or tracked count number
+                            labels.append(None if hide_labels else
+                                          (names[c] if hide_conf or not n else f'{names[c]} {n:.0f}'))
+                            box_colors.append(colors(c, True))
+
+                            #RubbishClass(record, tables.names)
+                            #mains.getNum(label,True)
+                            #mains.stringIsFull="已满载"
+
+                        overlay(im0, rdet[:, :4].tolist(), labels, box_colors)
+
+            s += '' if len(det) else '(no detections), '
+            records = make_records(det, tables, ids, numbers, stream=stream, frame=frame)
+            results.append(dict(p=p, im0=im0, save_path=save_path, crop=crop, s=s, records=records))
+        batch['results'] = results
+        times['postprocess'] = time.time() - t - times['nms']  # annotation, tracking, records
+        return batch
+
+    def sink(batch):
+        nonlocal stopped
+        t = time.time()
+        for i, r in enumerate(batch['results']):
+            p, im0, save_path, crop = r['p'], r['im0'], r['save_path'], r['crop']
+            j = batch['stream'][i]  # video writer index, file batches hold consecutive frames of one source
+            if webcam:
+                metrics.observe(f'latency_{j}', time.time() - batch['t_capture'][i])  # per-stream capture to result
+                metrics.tick(f'fps_{j}')
             # Stream results
-            im0 = annotator.result()
             if view_img:
+                t_display = time.time()
                 if platform.system() == 'Linux' and p not in windows:
                     windows.append(p)
                     cv2.namedWindow(str(p), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
                     cv2.resizeWindow(str(p), im0.shape[1], im0.shape[0])
-                if not pointList.pl==[]:
-                    w=640
-                    h=480
-                    x_, y_, w_, h_ = pointList.pl[0], pointList.pl[1], pointList.pl[2], pointList.pl[3]
-                    x1 = w * x_ - 0.5 * w * w_
-                    x2 = w * x_ + 0.5 * w * w_
-                    y1 = h * y_ - 0.5 * h * h_
-                    y2 = h * y_ + 0.5 * h * h_
-                    print(x1,y1,x2,y2)
-
-                    image=im0[int(y1):int(y1+math.fabs(y1-y2)),int(x1):int(x1+math.fabs(x1-x2))]
-                    cv2.imwrite('1.png', image)
-                    cv2.imshow("114514",image)
+                if crop is not None and crop.size:
+                    cv2.imshow("114514", crop)
                 cv2.imshow(str(p), im0)
                 cv2.waitKey(1)  # 1 millisecond
+                metrics.observe('display', time.time() - t_display)
 
             # Save results (image with detections)
             if save_img:
-                if dataset.mode == 'image':
-                    cv2.imwrite(save_path, im0)
+                t_write = time.time()
+                if vid_writer[j] is None:
+                    vid_writer[j] = VideoSink(drop=webcam)  # encode in background, live streams drop when behind
+                    metrics.gauge(f'writer_queue_{j}', vid_writer[j].queue.qsize)
+                if batch['mode'][i] == 'image':
+                    vid_writer[j].imwrite(save_path, im0)
                 else:  # 'video' or 'stream'
-                    if vid_path[i] != save_path:  # new video
-                        vid_path[i] = save_path
-                        if isinstance(vid_writer[i], cv2.VideoWriter):
-                            vid_writer[i].release()  # release previous video writer
-                        if vid_cap:  # video
-                            fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                            w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                    if vid_path[j] != save_path:  # new video
+                        vid_path[j] = save_path
+                        if batch['vid_info'][i]:  # video
+                            fps, w, h = batch['vid_info'][i]
                         else:  # stream
                             fps, w, h = 30, im0.shape[1], im0.shape[0]
                         save_path = str(Path(save_path).with_suffix('.mp4'))  # force *.mp4 suffix on results videos
-                        vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                    vid_writer[i].write(im0)
-
-        # Print time (inference-only)
-        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms")
+                        vid_writer[j].open(save_path, fps, (w, h))  # releases previous video writer
+                    vid_writer[j].write(im0)
+                metrics.observe('write', time.time() - t_write)
+
+            if sender:  # one code per confirmed object
+                with metrics.time('actuator'):
+                    confirmed = r['records'][r['records']['number'] > 0]
+                    for stream, track, code in confirmed[['stream', 'track', 'code']].tolist():
+                        if (stream, track) not in actuated:
+                            actuated.add((stream, track))
+                            sender.send(code, batch['t_capture'][i])  # this image's capture time
+
+            if callback:
+                with metrics.time('callback'):
+                    if callback(im0, r['records']) is False:
+                        stopped = True
+
+        if scheduler:
+            scheduler.update(batch['t0'], sum(x.dt for x in dt))
+
+        # Print time (inference-only, per batch)
+        lines = [''.join(r['s'] for r in batch['results'])] if webcam else [r['s'] for r in batch['results']]
+        for s in lines:
+            LOGGER.info(f"{s}{batch['t'] * 1E3:.1f}ms")
+        times = batch['times']
+        times.update(sink=time.time() - t, latency=time.time() - batch['t0'])
+        for k, v in times.items():
+            if k != 'n':
+                metrics.observe(k, v)
+        metrics.tick('fps', times['n'])
+        if timings is not None:
+            timings.append(times)
+        if profiler:
+            profiler.step(times['n'])
+
+    stages = (preprocess, inference, postprocess)
+    if pipeline:
+        # Stage threads do not inherit inference mode from run(), apply it per stage
+        pipe = Pipeline(capture(), [smart_inference_mode()(f) for f in stages], maxsize=pipeline_depth,
+                        policy=pipeline_policy)
+        for f, q in zip(stages, pipe.queues):
+            metrics.gauge(f'queue_{f.__name__}', q.qsize)  # batches waiting after each stage
+        for batch in pipe:
+            sink(batch)
+            if stopped:
+                break
+        LOGGER.info(f'Pipeline: {pipe.count} batches processed, {pipe.dropped} dropped ({pipeline_policy} policy)')
+    else:
+        for batch in capture():
+            for stage in stages:
+                batch = stage(batch)
+                if batch is None:  # skipped
+                    break
+            else:
+                sink(batch)
+                if stopped:
+                    break
+    if multistream and webcam:
+        dataset.close()  # stop capture threads
+        LOGGER.info(f'Streams: {dataset.stats()}')
+    if label_writer:
+        label_writer.close()  # flush labels
+    if crop_sink and crops is None:
+        crop_sink.close()  # write pending crops
+        LOGGER.info(f'Crops: {crop_sink.stats()}')
+    if scheduler:
+        LOGGER.info(f'Latency: {scheduler}')
+    if gate:
+        LOGGER.info(f'Motion gate: {gate}')
+    if cascade:
+        LOGGER.info(f'Cascade: {cascade}')
+    if classifier:
+        LOGGER.info(f'HSV classifier: {classifier}')
+    if overlay.hits + overlay.misses:
+        LOGGER.info(f'Overlay: {overlay}')
+    if trackers:
+        counts = {}
+        for k, tracker in sorted(trackers.items()):
+            for c, n in tracker.counts.items():
+                counts[c] = counts.get(c, 0) + n
+            if len(trackers) > 1:  # per-stream tally
+                tally = ', '.join(f'{n} {names[c]}' for c, n in sorted(tracker.counts.items())) or 'no objects'
+                LOGGER.info(f'Tracked stream {k}: {tally}')
+        LOGGER.info(f"Tracked: {', '.join(f'{n} {names[c]}' for c, n in sorted(counts.items())) or 'no objects'}")
+    if sender:
+        sender.close()  # send pending codes
+        LOGGER.info(f'Actuator: {sender.stats()}')
+    for j, writer in enumerate(vid_writer):
+        if writer:
+            writer.close()  # finish encoding
+            LOGGER.info(f'Output {j}: {writer.stats()}')
+    if profiler:
+        profiler.close()  # source ended inside the profiling window
+        LOGGER.info(f'Profile: saved to {profiler.saved}' if profiler.saved else 'Profile: too few frames, not saved')
+    if dump:
+        dump.close()  # final snapshot
+    if metrics_server:
+        metrics_server.close()
+    timers = metrics.snapshot()['timers']
+    LOGGER.info('Stages (p50/p95 ms): ' + ', '.join(f"{k} {v['p50']:.1f}/{v['p95']:.1f}" for k, v in timers.items()))
 
     # Print results
     t = tuple(x.t / seen * 1E3 for x in dt)  # speeds per image
-    LOGGER.info(f'Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {(1, 3, *imgsz)}' % t)
+    LOGGER.info(f'Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {(bs, 3, *imgsz)}' % t)
     if save_txt or save_img:
         s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ''
         LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
     if update:
         strip_optimizer(weights[0])  # update model (to fix SourceChangeWarning)
+    tracked = {}
+    for tracker in (trackers or {}).values():
+        for c, n in tracker.counts.items():
+            tracked[names[c]] = tracked.get(names[c], 0) + n
+    return dict(save_dir=str(save_dir), seen=seen, detections=detections, tracked=tracked)
 
 
 def parse_opt():
@@ -700,6 +1109,30 @@ def parse_opt():
     parser.add_argument('--half', action='store_true', help='use FP16 half-precision inference')
     parser.add_argument('--dnn', action='store_true', help='use OpenCV DNN for ONNX inference')
     parser.add_argument('--vid-stride', type=int, default=1, help='video frame-rate stride')
+    parser.add_argument('--batch-size', type=int, default=1, help='frames per inference batch for file sources')
+    parser.add_argument('--channels-last', action='store_true', help='use channels-last (NHWC) input memory layout')
+    parser.add_argument('--latency-budget', type=float, default=0, help='real-time mode latency budget (ms)')
+    parser.add_argument('--motion-thres', type=float, default=0.0, help='changed-pixel fraction to trigger inference')
+    parser.add_argument('--track', action='store_true', help='track objects across frames, count each one once')
+    parser.add_argument('--detect-interval', type=int, default=1, help='detect every N frames, track in between')
+    parser.add_argument('--pipeline', action='store_true', help='run inference stages concurrently')
+    parser.add_argument('--pipeline-depth', type=int, default=4, help='max batches queued between pipeline stages')
+    parser.add_argument('--pipeline-policy', default='block', choices=['block', 'drop'], help='pipeline backpressure')
+    parser.add_argument('--actuator', default=None, help='actuator port, i.e. /dev/ttyUSB0 or socket://host:port')
+    parser.add_argument('--actuator-baud', type=int, default=9600, help='actuator serial baud rate')
+    parser.add_argument('--hsv-ranges', type=str, default=None, help='HSV ranges yaml to confirm/relabel by colour')
+    parser.add_argument('--metrics-port', type=int, default=0, help='serve metrics on 127.0.0.1:port/metrics')
+    parser.add_argument('--metrics-file', type=str, default=None, help='dump metrics JSON to this file periodically')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='metrics file dump interval (s)')
+    parser.add_argument('--profile', type=str, default=None, choices=['torch', 'cprofile'], help='profile frames')
+    parser.add_argument('--profile-frames', type=int, default=100, help='frames to profile, after the first 10')
+    parser.add_argument('--server', type=str, default=None, help='run on a detect_server.py socket')
+    parser.add_argument('--multistream', action='store_true', help='batch streams independently, no lockstep')
+    parser.add_argument('--stream-fps', nargs='+', type=float, default=None, help='per-stream fps caps, 0 uncapped')
+    parser.add_argument('--roi', nargs=4, type=float, default=None, help='region of interest x1 y1 x2 y2, px or 0-1')
+    parser.add_argument('--cascade-imgsz', type=int, default=0, help='coarse pass size, refine candidates at --imgsz')
+    parser.add_argument('--cascade-thres', type=float, default=0.1, help='coarse candidate confidence threshold')
+    parser.add_argument('--nms-topk', type=int, default=0, help='few-class NMS with top-k candidates per class')
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
@@ -707,13 +1140,13 @@ def parse_opt():
 
 
 def main(opt):
-    check_requirements(exclude=('tensorboard', 'thop'))
+    if not opt.server:  # the server checked its own environment
+        check_requirements(exclude=('tensorboard', 'thop'))
     run(**vars(opt))
 
 
 
 if __name__ == "__main__":
-    pointList=shit()
     opt = parse_opt()
     main(opt)
 
@@ -0,0 +1,191 @@
+# YOLOv5 🚀 by Ultralytics, GPL-3.0 license
+"""
+Benchmark detect.py run() over image sizes, batch sizes, precisions and source types, writing JSON to diff between
+commits. Per-stage latencies are per image (batch time / batch size), the first --warmup batches are excluded.
+
+Sources:
+    synthetic-video    generated mp4 of --frames frames (deterministic, --seed)
+    synthetic-images   generated folder of --frames jpg images
+    path/to/video.mp4  any detect.py --source, recorded footage is processed in full
+
+Usage:
+    $ python detect_benchmark.py --weights best_114514.pt --imgsz 640 1280 --batch-size 1 4 --half 0 1
+    $ python detect_benchmark.py --source synthetic-video video.mp4 --out runs/benchmark/main.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
+
+from utils.general import LOGGER, git_describe, print_args
+from detect import run
+from telemetry import percentiles
+
+STAGES = 'preprocess', 'inference', 'nms', 'postprocess', 'sink', 'latency'
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss():
+    # Resident set size of this process (bytes)
+    if psutil:
+        return psutil.Process().memory_info().rss
+    with open('/proc/self/statm') as f:  # Linux without psutil
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakRSS:
+    # Samples rss() in a background thread, i.e. 'with PeakRSS() as m: ...; m.peak'
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self.stop = threading.Event()
+
+    def __enter__(self):
+        self.peak = rss()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss())
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            self.peak = max(self.peak, rss())
+
+
+def synthetic(kind, dir, n=100, size=(1280, 720), seed=0):
+    # Write a deterministic synthetic source: textured background with moving coloured boxes, returns its path
+    rng = np.random.default_rng(seed)
+    w, h = size
+    background = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 5)
+    boxes = rng.uniform(0, 1, (8, 4)) * (w, h, w / 6, h / 6)  # x, y, w, h
+    velocity = rng.uniform(-8, 8, (8, 2))
+    colours = rng.integers(0, 255, (8, 3)).tolist()
+    if kind == 'synthetic-video':
+        path = Path(dir) / 'synthetic.mp4'
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 30, size)
+    else:
+        path, writer = Path(dir) / 'synthetic', None
+        path.mkdir(exist_ok=True)
+    for i in range(n):
+        im = background.copy()
+        for (x, y, bw, bh), (vx, vy), c in zip(boxes, velocity, colours):
+            x, y = (x + vx * i) % w, (y + vy * i) % h
+            cv2.rectangle(im, (int(x), int(y)), (int(x + bw), int(y + bh)), c, -1)
+        if writer:
+            writer.write(im)
+        else:
+            cv2.imwrite(str(path / f'{i:06d}.jpg'), im)
+    if writer:
+        writer.release()
+    return str(path)
+
+
+def benchmark(source, warmup=3, allocations=False, **kwargs):
+    # Run detect.run() once on source, returns a result dict
+    timings, frames, last = [], [], [0]
+
+    def callback(im0, records):  # allocations pass only: Python heap peak above the previous frame's live size
+        current, peak = tracemalloc.get_traced_memory()
+        frames.append(peak - last[0])
+        last[0] = current
+        tracemalloc.reset_peak()
+
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    with PeakRSS() as memory:
+        t = time.time()
+        run(source=source, timings=timings, nosave=True, **kwargs)
+        t = time.time() - t
+    result = dict(batches=len(timings), images=sum(x['n'] for x in timings), seconds=round(t, 3),
+                  fps=round(sum(x['n'] for x in timings) / t, 2), peak_rss_mb=round(memory.peak / 2 ** 20, 1))
+    if torch.cuda.is_available():
+        result['cuda_peak_mb'] = round(torch.cuda.max_memory_allocated() / 2 ** 20, 1)
+    timed = timings[warmup:] or timings
+    result['stages'] = {k: percentiles([x[k] / (1 if k == 'latency' else x['n']) for x in timed]) for k in STAGES}
+
+    if allocations:  # separate pass, tracing slows everything down
+        tracemalloc.start()
+        run(source=source, nosave=True, callback=callback, **kwargs)
+        tracemalloc.stop()
+        kb = [x / 1024 for x in frames[warmup:] or frames]
+        result['python_alloc_peak_kb_per_frame'] = dict(p50=round(float(np.median(kb)), 1), max=round(max(kb), 1))
+    return result
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', nargs='+', type=str, default=ROOT / 'best_114514.pt', help='model path(s)')
+    parser.add_argument('--data', type=str, default=ROOT / 'data/coco128.yaml', help='(optional) dataset.yaml path')
+    parser.add_argument('--source', nargs='+', type=str, default=['synthetic-video'], help='sources, see module doc')
+    parser.add_argument('--imgsz', '--img', '--img-size', nargs='+', type=int, default=[640, 1280], help='sizes')
+    parser.add_argument('--batch-size', nargs='+', type=int, default=[1, 4], help='batch sizes')
+    parser.add_argument('--half', nargs='+', type=int, default=[0], help='FP16 settings to test, i.e. 0 1')
+    parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--frames', type=int, default=100, help='frames per synthetic source')
+    parser.add_argument('--synthetic-size', nargs=2, type=int, default=[1280, 720], help='synthetic frame w h')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic source seed')
+    parser.add_argument('--warmup', type=int, default=3, help='batches excluded from latency percentiles')
+    parser.add_argument('--allocations', action='store_true', help='extra tracemalloc pass per configuration')
+    parser.add_argument('--pipeline', action='store_true', help='benchmark detect.py --pipeline')
+    parser.add_argument('--out', type=str, default=ROOT / 'runs/benchmark/benchmark.json', help='JSON results file')
+    return parser.parse_args()
+
+
+def main(opt):
+    tmp = tempfile.TemporaryDirectory()
+    sources = {s: synthetic(s, tmp.name, opt.frames, tuple(opt.synthetic_size), opt.seed) if s.startswith('synthetic')
+               else s for s in opt.source}
+    results = []
+    for (name, source), imgsz, bs, half in itertools.product(sources.items(), opt.imgsz, opt.batch_size, opt.half):
+        config = dict(source=name, imgsz=imgsz, batch_size=bs, half=bool(half), pipeline=opt.pipeline)
+        LOGGER.info(f'\nBenchmarking {config}')
+        r = benchmark(source, opt.warmup, opt.allocations, weights=opt.weights, data=opt.data, imgsz=(imgsz, imgsz),
+                      batch_size=bs, half=bool(half), device=opt.device, pipeline=opt.pipeline,
+                      project=tmp.name, exist_ok=True)
+        results.append(dict(config, **r))
+    tmp.cleanup()
+
+    # Print and save
+    for r in results:
+        s = ', '.join(f"{k} {r['stages'][k]['p50']:.1f}/{r['stages'][k]['p95']:.1f}/{r['stages'][k]['p99']:.1f}"
+                      for k in STAGES if r['stages'][k])
+        LOGGER.info(f"{r['source']} {r['imgsz']} bs{r['batch_size']}{' fp16' if r['half'] else ''}: "
+                    f"{r['fps']:.1f} FPS, {r['peak_rss_mb']:.0f}MB RSS, p50/p95/p99 ms {s}")
+    Path(opt.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(opt.out, 'w') as f:
+        json.dump(dict(git=git_describe(), python=platform.python_version(), torch=torch.__version__,
+                       device=opt.device or ('0' if torch.cuda.is_available() else 'cpu'), weights=str(opt.weights),
+                       results=results), f, indent=2)
+    LOGGER.info(f'Results saved to {opt.out}')
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    print_args(vars(opt))
+    main(opt)
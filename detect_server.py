@@ -0,0 +1,261 @@
+# YOLOv5 🚀 by Ultralytics, GPL-3.0 license
+"""
+Persistent detection server: loads and warms the model once, then serves jobs over a Unix socket, so each client
+starts in milliseconds instead of seconds.
+
+Usage - server:
+    $ python detect_server.py --weights best_114514.pt --socket /tmp/detect.sock
+
+Usage - clients:
+    $ python detect.py --server /tmp/detect.sock --source video.mp4    # run() as a thin client, any detect.py options
+    client = DetectClient('/tmp/detect.sock')
+    records = client.detect(im0)                                        # one BGR frame -> records.RECORD array
+    for im0, records in client.run('video.mp4', frames=True): ...       # stream a detect.py run
+
+Protocol: each message is a uint32 header length, a JSON header and the payloads whose sizes are listed in
+header['sizes']. Frames are raw uint8 arrays with header['shape'], records are raw records.RECORD arrays.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
+
+from records import RECORD, LabelTables, make_records  # numpy only, torch and the model code load in the server
+
+LENGTH = struct.Struct('<I')
+
+
+def send(sock, header, *payloads):
+    # Send one message: header dict and bytes-like payloads
+    header = dict(header, sizes=[memoryview(x).nbytes for x in payloads])
+    h = json.dumps(header).encode()
+    sock.sendall(LENGTH.pack(len(h)) + h)
+    for x in payloads:
+        sock.sendall(x)
+
+
+def recv(sock):
+    # Receive one message, returns (header, [payload bytes, ...]) or (None, []) at end of stream
+    n = _recv_exactly(sock, LENGTH.size)
+    if n is None:
+        return None, []
+    header = json.loads(_recv_exactly(sock, LENGTH.unpack(n)[0]))
+    return header, [_recv_exactly(sock, size) for size in header.get('sizes', [])]
+
+
+def _recv_exactly(sock, n):
+    buffer, i = bytearray(n), 0
+    view = memoryview(buffer)
+    while i < n:
+        k = sock.recv_into(view[i:], n - i)
+        if not k:
+            if i:
+                raise ConnectionError('connection closed mid-message')
+            return None
+        i += k
+    return bytes(buffer)
+
+
+class DetectClient:
+    # Client of a detect_server.py socket, one connection per client
+    def __init__(self, path='/tmp/detect.sock', timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(str(path))
+        self.summary = None  # run() summary of the last job that ran to completion
+
+    def detect(self, im, **options):
+        # Detect one BGR uint8 frame, options override the server's thresholds (conf_thres, iou_thres, classes, ...)
+        im = np.ascontiguousarray(im)
+        send(self.sock, dict(op='detect', shape=im.shape, options=options), im)
+        header, payloads = self._reply()
+        return np.frombuffer(payloads[0], dtype=RECORD)
+
+    def run(self, source, frames=False, **options):
+        # Run detect.py run() on the server, yields (annotated im0 or None, records) per image. Stop by close()
+        self.summary = None
+        send(self.sock, dict(op='run', source=str(source), frames=frames, options=options))
+        while True:
+            header, payloads = self._reply()
+            if header.get('done'):
+                self.summary = header.get('summary')
+                return
+            im0 = np.frombuffer(payloads[1], dtype=np.uint8).reshape(header['shape']) if frames else None
+            yield im0, np.frombuffer(payloads[0], dtype=RECORD)
+
+    def names(self):
+        # Class names of the server's model
+        send(self.sock, dict(op='names'))
+        return self._reply()[0]['names']
+
+    def close(self):
+        self.sock.close()
+
+    def _reply(self):
+        header, payloads = recv(self.sock)
+        if header is None:
+            raise ConnectionError('detect server closed the connection')
+        if 'error' in header:
+            raise RuntimeError(f"detect server: {header['error']}")
+        return header, payloads
+
+
+def remote_run(server, callback=None, **options):
+    # detect.py run() through a server: same options and summary, callback(im0, records) per image, False to stop
+    from utils.general import LOGGER  # only called from detect.py, which has loaded utils already
+
+    client = DetectClient(server)
+    t, seen, counts = time.time(), 0, {}
+    try:
+        names = client.names() if callback else None  # to summarize a run the callback stops early
+        for im0, records in client.run(options.pop('source'), frames=callback is not None, **options):
+            seen += 1
+            for c in records['cls'].tolist():
+                counts[c] = counts.get(c, 0) + 1
+            if callback and callback(im0, records) is False:
+                break
+        summary = client.summary
+        if summary is None:  # stopped early, the server's run() never returned, summarize what arrived
+            summary = dict(save_dir=None, seen=seen, detections={names[c]: n for c, n in counts.items()}, tracked={})
+    finally:
+        client.close()
+    LOGGER.info(f"{seen} images from {server} in {time.time() - t:.1f}s, detections: {summary['detections'] or 'none'}")
+    return summary
+
+
+class DetectServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Holds one warm DetectMultiBackend and serves 'detect' (single frame) and 'run' (detect.py job) requests.
+
+    Each connection is handled in its own thread, model use is serialized by a lock.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, model, imgsz=(640, 640), conf_thres=0.25, iou_thres=0.45, max_det=1000):
+        from preprocess import InputBuffer
+        from utils.torch_utils import smart_inference_mode
+
+        self.detect = smart_inference_mode()(self.detect)  # decorated here, clients never import torch
+        self.model = model
+        self.imgsz = imgsz
+        self.defaults = dict(conf_thres=conf_thres, iou_thres=iou_thres, classes=None, agnostic_nms=False,
+                             max_det=max_det)
+        self.tables = LabelTables(model.names)
+        self.input_buffer = InputBuffer(model.device, model.fp16)
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            os.unlink(path)  # stale socket from a previous server
+        super().__init__(str(path), Handler)
+
+    def detect(self, im0, options):
+        from utils.augmentations import letterbox
+        from utils.general import non_max_suppression, scale_coords
+
+        o = dict(self.defaults, **options)
+        im = letterbox(im0, self.imgsz, stride=self.model.stride, auto=self.model.pt)[0]
+        im = im.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
+        with self.lock:
+            im = self.input_buffer(im)
+            pred = self.model(im)
+            det = non_max_suppression(pred, o['conf_thres'], o['iou_thres'], o['classes'], o['agnostic_nms'],
+                                      max_det=o['max_det'])[0]
+        det[:, :4] = scale_coords(im.shape[2:], det[:, :4], im0.shape).round()
+        return make_records(det, self.tables)
+
+    def run(self, sock, source, frames, options):
+        from detect import run  # detect.py imports this module for --server
+
+        def callback(im0, records):
+            try:
+                if frames:
+                    send(sock, dict(shape=im0.shape), records, np.ascontiguousarray(im0))
+                else:
+                    send(sock, {}, records)
+            except OSError:  # client gone, stop the job
+                return False
+
+        options = dict(dict(imgsz=self.imgsz, **self.defaults), **options)
+        with self.lock:
+            return run(model=self.model, source=source, callback=callback, **options)
+
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            header, payloads = recv(self.request)
+            if header is None:
+                return
+            try:
+                if header['op'] == 'detect':
+                    im0 = np.frombuffer(payloads[0], dtype=np.uint8).reshape(header['shape'])
+                    send(self.request, {}, self.server.detect(im0, header.get('options', {})))
+                elif header['op'] == 'run':
+                    summary = self.server.run(self.request, header['source'], header['frames'],
+                                              header.get('options', {}))
+                    send(self.request, dict(done=True, summary=summary))
+                elif header['op'] == 'names':
+                    send(self.request, dict(names=self.server.tables.names))
+                else:
+                    send(self.request, dict(error=f"invalid op '{header['op']}'"))
+            except OSError:
+                return
+            except Exception as e:
+                send(self.request, dict(error=repr(e)))
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', nargs='+', type=str, default=ROOT / 'best_114514.pt', help='model path(s)')
+    parser.add_argument('--socket', type=str, default='/tmp/detect.sock', help='Unix socket path')
+    parser.add_argument('--data', type=str, default=ROOT / 'data/coco128.yaml', help='(optional) dataset.yaml path')
+    parser.add_argument('--imgsz', '--img', '--img-size', nargs='+', type=int, default=[1280], help='inference h,w')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='default confidence threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='default NMS IoU threshold')
+    parser.add_argument('--max-det', type=int, default=1000, help='default maximum detections per image')
+    parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--half', action='store_true', help='use FP16 half-precision inference')
+    parser.add_argument('--dnn', action='store_true', help='use OpenCV DNN for ONNX inference')
+    opt = parser.parse_args()
+    opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
+    return opt
+
+
+def main(opt):
+    from models.common import DetectMultiBackend
+    from utils.general import LOGGER, check_img_size, check_requirements, print_args
+    from utils.torch_utils import select_device
+
+    print_args(vars(opt))
+    check_requirements(exclude=('tensorboard', 'thop'))
+    t = time.time()
+    model = DetectMultiBackend(opt.weights, device=select_device(opt.device), dnn=opt.dnn, data=opt.data, fp16=opt.half)
+    imgsz = check_img_size(opt.imgsz, s=model.stride)
+    model.warmup(imgsz=(1, 3, *imgsz))
+    server = DetectServer(opt.socket, model, imgsz, opt.conf_thres, opt.iou_thres, opt.max_det)
+    LOGGER.info(f'Model ready in {time.time() - t:.1f}s, serving on {opt.socket}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(opt.socket)
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    main(opt)
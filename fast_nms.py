@@ -0,0 +1,68 @@
+"""
+Post-processing for `detect.py --nms-topk`: a drop-in for utils.general.non_max_suppression tuned for models with a
+handful of classes and few objects per frame, benchmarked against it by nms_benchmark.py.
+"""
+
+import torch
+import torchvision
+
+from utils.general import xywh2xyxy
+from utils.metrics import box_iou
+
+
+def topk_nms(prediction, conf_thres=0.25, iou_thres=0.45, classes=None, agnostic=False, max_det=300, topk=100,
+             max_matrix=2048):
+    """Non-Maximum Suppression with per-class top-k, returns a list of (n, 6) tensors [xyxy, conf, cls] per image.
+
+    Confidence and class filtering run on the whole batch at once, then only the topk most confident candidates of
+    each (image, class) are kept, which bounds the suppression work by classes instead of anchors. Up to max_matrix
+    candidates are suppressed with one IoU matrix, iterating greedy NMS to its fixed point (same result as
+    torchvision.ops.nms, in a few matrix steps instead of a kernel per image), more fall back to batched_nms.
+    Best class only, like non_max_suppression(multi_label=False).
+    """
+    if isinstance(prediction, (list, tuple)):  # inference and loss outputs
+        prediction = prediction[0]
+    bs, nc = prediction.shape[0], prediction.shape[2] - 5
+    output = [torch.zeros((0, 6), device=prediction.device)] * bs
+
+    # Candidates of all images: objectness, then best class confidence
+    b, i = (prediction[..., 4] > conf_thres).nonzero(as_tuple=True)
+    x = prediction[b, i]
+    conf, j = (x[:, 5:] * x[:, 4:5]).max(1)
+    keep = conf > conf_thres
+    if classes is not None:
+        keep &= (j[:, None] == torch.tensor(classes, device=j.device)).any(1)
+    b, x, conf, j = b[keep], x[keep], conf[keep], j[keep]
+    if not len(b):
+        return output
+
+    # Top-k per group (image, class), sorted by group then confidence
+    group = b if agnostic else b * nc + j
+    order = conf.argsort(descending=True)
+    order = order[torch.sort(group[order], stable=True)[1]]
+    g = group[order]
+    rank = torch.arange(len(g), device=g.device) - torch.searchsorted(g, g)  # position within the group
+    order = order[rank < topk]
+    b, g, conf, j = b[order], group[order], conf[order], j[order]
+    boxes = xywh2xyxy(x[order, :4])
+
+    # Suppression
+    if len(g) <= max_matrix:
+        # suppress[p, q]: p before q in the same group (so more confident) and overlapping
+        suppress = (box_iou(boxes, boxes) > iou_thres) & (g[:, None] == g[None])
+        suppress.triu_(diagonal=1)
+        kept = torch.ones(len(g), dtype=torch.bool, device=g.device)
+        while True:  # a box survives if no surviving box suppresses it, converges along suppression chains
+            update = ~(suppress & kept[:, None]).any(0)
+            if torch.equal(update, kept):
+                break
+            kept = update
+        kept = kept.nonzero(as_tuple=True)[0]
+    else:
+        kept = torchvision.ops.batched_nms(boxes, conf, g, iou_thres)
+    det = torch.cat((boxes, conf[:, None], j[:, None].float()), 1)[kept]
+    b = b[kept]
+    for xi in b.unique().tolist():
+        d = det[b == xi]
+        output[xi] = d[d[:, 4].argsort(descending=True)[:max_det]]
+    return output
@@ -1,15 +1,56 @@
+import argparse
+import time
+
 import cv2
-import numpy as np
-from matplotlib import pyplot as plt
+import yaml
+
+from hsv import calibrate, save_ranges
+
+
+def show(image):
+    """交互模式：点击imageHSV窗口中的像素，打印该点的HSV值"""
+    image=cv2.imread(image)
+    HSV=cv2.cvtColor(image,cv2.COLOR_BGR2HSV)
+    def getpos(event,x,y,flags,param):
+        if event==cv2.EVENT_LBUTTONDOWN: #定义一个鼠标左键按下去的事件
+            print(HSV[y,x])
+
+    cv2.imshow("imageHSV",HSV)
+    cv2.imshow('image',image)
+    cv2.setMouseCallback("imageHSV",getpos)
+    cv2.waitKey(0)
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description='HSV ranges for detect.py --hsv-ranges')
+    parser.add_argument('--source', type=str, default=None,
+                        help='crops folder (a sub-folder per class) or YOLO dataset folder (with --data)')
+    parser.add_argument('--data', type=str, default=None, help='dataset.yaml with class names, for YOLO label files')
+    parser.add_argument('--out', type=str, default='hsv_ranges.yaml', help='ranges file to write')
+    parser.add_argument('--workers', type=int, default=8, help='max worker processes')
+    parser.add_argument('--percentile', type=float, default=2.0, help='ignore this percent of pixels at each end')
+    parser.add_argument('--inset', type=float, default=0.1, help='shrink label boxes by this fraction per side')
+    parser.add_argument('--image', type=str, default='Screenshot from 2023-05-24 23-18-12.png',
+                        help='image to inspect by clicking when no --source is given')
+    return parser.parse_args()
+
 
+def main(opt):
+    if opt.source is None:
+        show(opt.image)
+        return
+    names = None
+    if opt.data:
+        with open(opt.data, errors='ignore') as f:
+            names = yaml.safe_load(f)['names']
+    t = time.time()
+    ranges, pixels = calibrate(opt.source, names, opt.workers, opt.percentile, opt.inset)
+    save_ranges(opt.out, ranges)
+    for k, v in ranges.items():
+        print(f'{k}: {v[0]} ({pixels[k]} pixels)')
+    print(f'{len(ranges)} class ranges saved to {opt.out} in {time.time() - t:.1f}s')
 
-image=cv2.imread('Screenshot from 2023-05-24 23-18-12.png')
-HSV=cv2.cvtColor(image,cv2.COLOR_BGR2HSV)
-def getpos(event,x,y,flags,param):
-    if event==cv2.EVENT_LBUTTONDOWN: #定义一个鼠标左键按下去的事件
-        print(HSV[y,x])
 
-cv2.imshow("imageHSV",HSV)
-cv2.imshow('image',image)
-cv2.setMouseCallback("imageHSV",getpos)
-cv2.waitKey(0)
\ No newline at end of file
+if __name__ == "__main__":
+    opt = parse_opt()
+    main(opt)
@@ -0,0 +1,192 @@
+"""
+HSV colour range classifier for `detect.py --hsv-ranges`: confirms or relabels look-alike classes (i.e. red_carrot vs
+white_carrot) from the colour of their boxes, without another network pass.
+
+Ranges file (yaml), OpenCV HSV units (H 0-179, S 0-255, V 0-255), any number of ranges per class name:
+    red_carrot: [[0, 80, 60, 12, 255, 255], [165, 80, 60, 179, 255, 255]]  # [h_lo, s_lo, v_lo, h_hi, s_hi, v_hi]
+    white_carrot: [[0, 0, 150, 179, 60, 255]]
+A range with h_lo > h_hi wraps around 179/0.
+
+Usage:
+    classifier = HSVClassifier(load_ranges('ranges.yaml'), model.names)
+    cls, keep = classifier(im0, boxes, cls)  # boxes (n, 4) xyxy im0 pixels, cls (n,)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+BITS = 5  # quantization bits per BGR channel of the lookup table
+
+
+def load_ranges(file):
+    # Read {class name: [[h_lo, s_lo, v_lo, h_hi, s_hi, v_hi], ...]} from a yaml ranges file
+    with open(file, errors='ignore') as f:
+        ranges = yaml.safe_load(f) or {}
+    return {k: np.array(v, dtype=int).reshape(-1, 6) for k, v in ranges.items()}
+
+
+def in_ranges(hsv, ranges):
+    # Boolean mask of HSV pixels (..., 3) inside any of ranges (m, 6)
+    h, s, v = (hsv[..., i].astype(int) for i in range(3))
+    mask = np.zeros(hsv.shape[:-1], dtype=bool)
+    for h0, s0, v0, h1, s1, v1 in ranges.tolist():
+        hue = (h >= h0) & (h <= h1) if h0 <= h1 else (h >= h0) | (h <= h1)  # wrap-around red
+        mask |= hue & (s >= s0) & (s <= s1) & (v >= v0) & (v <= v1)
+    return mask
+
+
+class HSVClassifier:
+    """Scores each box by the fraction of its pixels inside every ranged class, using one BGR lookup table.
+
+    The table maps each quantized BGR colour to a bit mask of the classes whose HSV ranges contain it, so no colour
+    conversion runs per frame. All boxes of a frame are sampled on a size x size grid (inset from the box edges to
+    avoid background) with a single gather. A box of a ranged class is relabelled to the best scoring ranged class when
+    that class reaches min_fraction and beats its own, and dropped if drop=True and no ranged class reaches it.
+    """
+
+    def __init__(self, ranges, names, min_fraction=0.25, size=16, inset=0.1, drop=False):
+        names = [names[i] for i in range(len(names))]
+        ranges = {names.index(k): v for k, v in ranges.items() if k in names}  # class id: ranges
+        assert len(ranges) <= 32, 'HSVClassifier supports up to 32 ranged classes'
+        self.classes = np.array(sorted(ranges), dtype=int)  # ranged class ids, bit k is classes[k]
+        self.min_fraction = min_fraction
+        self.size = size
+        self.inset = inset
+        self.drop = drop
+        self.relabelled, self.dropped = 0, 0
+
+        # Lookup table: quantized BGR colour (b, g, r) -> bit mask of ranged classes
+        q = (np.arange(1 << BITS) << (8 - BITS)) + (1 << (7 - BITS))  # bin centres
+        bgr = np.stack(np.meshgrid(q, q, q, indexing='ij'), -1).reshape(-1, 1, 3).astype(np.uint8)
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)[:, 0]
+        self.lut = np.zeros(len(hsv), dtype=np.uint32)
+        for k, c in enumerate(self.classes):
+            self.lut |= in_ranges(hsv, ranges[c]).astype(np.uint32) << np.uint32(k)
+
+    def scores(self, im, boxes):
+        # Fraction of sampled pixels of each box (n, 4) xyxy inside each ranged class, returns (n, len(classes))
+        h, w = im.shape[:2]
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        d = (boxes[:, 2:] - boxes[:, :2]) * self.inset
+        x1y1, x2y2 = boxes[:, :2] + d, boxes[:, 2:] - d
+        g = (np.arange(self.size, dtype=np.float32) + 0.5) / self.size  # sample grid (0-1)
+        xs = np.clip(x1y1[:, :1] + (x2y2[:, :1] - x1y1[:, :1]) * g, 0, w - 1).astype(int)  # (n, size)
+        ys = np.clip(x1y1[:, 1:] + (x2y2[:, 1:] - x1y1[:, 1:]) * g, 0, h - 1).astype(int)
+        px = im[ys[:, :, None], xs[:, None, :]].reshape(len(boxes), -1, 3) >> (8 - BITS)  # (n, size * size, 3)
+        bits = self.lut[(px[..., 0].astype(int) << 2 * BITS) | (px[..., 1].astype(int) << BITS) | px[..., 2]]
+        return ((bits[..., None] >> np.arange(len(self.classes), dtype=np.uint32)) & 1).mean(1)
+
+    def __call__(self, im, boxes, cls):
+        # Relabel/confirm ranged-class boxes of BGR image im, returns new classes (n,) and a keep mask (n,)
+        cls = np.asarray(cls).astype(int)
+        keep = np.ones(len(cls), dtype=bool)
+        i = np.flatnonzero(np.isin(cls, self.classes))  # boxes of ranged classes
+        if not len(i):
+            return cls, keep
+        scores = self.scores(im, np.asarray(boxes)[i])
+        own = scores[np.arange(len(i)), np.searchsorted(self.classes, cls[i])]
+        best = scores.argmax(1)
+        top = scores[np.arange(len(i)), best]
+        relabel = (top >= self.min_fraction) & (top > own)
+        cls[i[relabel]] = self.classes[best[relabel]]
+        self.relabelled += int(relabel.sum())
+        if self.drop:
+            keep[i[top < self.min_fraction]] = False
+            self.dropped += int(len(i) - keep[i].sum())
+        return cls, keep
+
+    def __str__(self):
+        return f'{self.relabelled} boxes relabelled, {self.dropped} dropped by HSV ranges'
+
+
+# Calibration ----------------------------------------------------------------------------------------------------------
+IMG_FORMATS = 'bmp', 'jpeg', 'jpg', 'png', 'tif', 'tiff', 'webp'  # calibration image suffixes
+
+
+def label_file(image):
+    # YOLO label path of an image, /images/ -> /labels/ and *.txt
+    sa, sb = f'{os.sep}images{os.sep}', f'{os.sep}labels{os.sep}'
+    return os.path.splitext(sb.join(image.rsplit(sa, 1)))[0] + '.txt'
+
+
+def histograms(image, name=None, names=None, inset=0.1):
+    # HSV histograms {class name: (h (180,), s (256,), v (256,))} of one image: a crop of class name, or all boxes of
+    # its YOLO label file (class ids indexing names). Runs in calibrate() worker processes
+    im = cv2.imread(image)
+    if im is None:
+        return {}
+    hsv = cv2.cvtColor(im, cv2.COLOR_BGR2HSV)
+    if name is not None:
+        regions = [(name, hsv)]
+    else:
+        file, regions = label_file(image), []
+        if not os.path.isfile(file):
+            return {}
+        h, w = hsv.shape[:2]
+        for c, x, y, bw, bh in np.loadtxt(file, ndmin=2, usecols=range(5)).tolist():  # normalized xywh
+            bw, bh = bw * (1 - 2 * inset), bh * (1 - 2 * inset)
+            x1, y1 = max(int((x - bw / 2) * w), 0), max(int((y - bh / 2) * h), 0)
+            x2, y2 = int((x + bw / 2) * w), int((y + bh / 2) * h)
+            if x2 > x1 and y2 > y1:
+                regions.append((names[int(c)], hsv[y1:y2, x1:x2]))
+    hists = {}
+    for k, x in regions:
+        x = x.reshape(-1, 3)
+        hist = [np.bincount(x[:, i], minlength=n) for i, n in enumerate((180, 256, 256))]
+        hists[k] = [a + b for a, b in zip(hists[k], hist)] if k in hists else hist
+    return hists
+
+
+def percentile_range(hist, p, circular=False):
+    # Lower and upper p-th percentile bins of a histogram, a circular (hue) range may wrap, i.e. (170, 10)
+    shift = 0
+    if circular:  # start at the least populated hue so a range across 179/0 stays contiguous
+        n = len(hist)
+        smooth = np.convolve(np.concatenate((hist[-4:], hist, hist[:4])), np.ones(9), 'valid')
+        shift = int(smooth.argmin())
+        hist = np.roll(hist, -shift)
+    c = np.cumsum(hist) / max(hist.sum(), 1)
+    lo, hi = int(np.searchsorted(c, p / 100)), int(np.searchsorted(c, 1 - p / 100))
+    return ((lo + shift) % n, (hi + shift) % n) if circular else (lo, hi)
+
+
+def calibrate(source, names=None, workers=8, percentile=2.0, inset=0.1):
+    """Per-class HSV ranges from a folder of labelled images, returns ({name: [[h_lo, ..., v_hi]]}, {name: pixels}).
+
+    source is either a crops folder with one sub-folder per class name (i.e. detect.py --save-crop output), or a YOLO
+    dataset folder (images/ and labels/) when names (class id order) is given. Images are histogrammed in a process
+    pool and ranges are the [percentile, 100 - percentile] bins of each summed channel histogram.
+    """
+    files = sorted(str(f) for f in Path(source).rglob('*') if f.suffix[1:].lower() in IMG_FORMATS)
+    jobs = [(f, None if names else Path(f).parent.name) for f in files]
+    if names is not None:
+        names = [names[i] for i in range(len(names))]
+    totals = {}
+    with ProcessPoolExecutor(max(workers, 1)) as pool:
+        for hists in pool.map(partial(_histograms, names=names, inset=inset), jobs, chunksize=64):
+            for k, hist in hists.items():
+                totals[k] = [a + b for a, b in zip(totals[k], hist)] if k in totals else hist
+    ranges, pixels = {}, {}
+    for k in sorted(totals):
+        (h0, h1), (s0, s1), (v0, v1) = (percentile_range(x, percentile, i == 0) for i, x in enumerate(totals[k]))
+        ranges[k], pixels[k] = [[h0, s0, v0, h1, s1, v1]], int(totals[k][0].sum())
+    return ranges, pixels
+
+
+def save_ranges(file, ranges):
+    # Write ranges for load_ranges(), one flow-style line per class
+    with open(file, 'w') as f:
+        f.write('# HSV ranges (OpenCV H 0-179, S 0-255, V 0-255), [h_lo, s_lo, v_lo, h_hi, s_hi, v_hi]\n')
+        for k, v in ranges.items():
+            f.write(f'{k}: {yaml.safe_dump(v, default_flow_style=True).strip()}\n')
+
+
+def _histograms(job, names=None, inset=0.1):
+    image, name = job
+    return histograms(image, name, names, inset)
@@ -0,0 +1,48 @@
+"""
+Cheap change detection in front of the detector for `detect.py --motion-thres`.
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Downsampled frame differencing, i.e. `if gate.check(keys, im0s): pred = model(im)`
+
+    Each key (stream index) keeps a reference thumbnail of the last frame inference ran on. A batch is 'changed' when
+    the fraction of thumbnail pixels that differ from the reference by more than pixel_thres exceeds thres in any
+    of its frames. References only move on changed batches, so slow drift accumulates until it triggers inference.
+    """
+
+    def __init__(self, thres=0.01, pixel_thres=25, size=64):
+        self.thres = thres  # changed-pixel fraction that triggers inference
+        self.pixel_thres = pixel_thres  # grayscale difference (0-255) for a pixel to count as changed
+        self.size = size  # thumbnail width (pixels)
+        self.reference = {}  # key: thumbnail
+        self.seen, self.skipped = 0, 0  # frames checked, frames that reused previous detections
+
+    def thumb(self, im):
+        # BGR image to blurred grayscale thumbnail
+        h, w = im.shape[:2]
+        x = cv2.resize(im, (self.size, max(round(self.size * h / w), 1)), interpolation=cv2.INTER_AREA)
+        x = cv2.cvtColor(x, cv2.COLOR_BGR2GRAY) if x.ndim == 3 else x
+        return cv2.GaussianBlur(x, (3, 3), 0)
+
+    def changed(self, key, x):
+        ref = self.reference.get(key)
+        if ref is None or ref.shape != x.shape:
+            return True
+        return np.count_nonzero(cv2.absdiff(x, ref) > self.pixel_thres) > self.thres * x.size
+
+    def check(self, keys, ims):
+        # Return True if inference is needed for this batch of images, updating references if so
+        thumbs = [self.thumb(im) for im in ims]
+        self.seen += len(thumbs)
+        if any(self.changed(k, x) for k, x in zip(keys, thumbs)):
+            self.reference.update(zip(keys, thumbs))  # later frames of a shared key win
+            return True
+        self.skipped += len(thumbs)
+        return False
+
+    def __str__(self):
+        return f'{self.skipped}/{self.seen} frames reused previous detections ({self.skipped / max(self.seen, 1):.1%})'
@@ -0,0 +1,136 @@
+"""
+Independent multi-camera capture for `detect.py --multistream`: each stream is read in its own thread and inference
+batches are built from whichever streams have a new frame, instead of stepping all streams in lockstep.
+
+Usage:
+    dataset = StreamScheduler('streams.txt', img_size=(640, 640), fps=[10, 30])
+    for batch in dataset:  # batch['stream'] holds the stream index of each image
+        ...
+"""
+
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils.augmentations import letterbox
+from utils.general import LOGGER, clean_str
+
+
+class StreamScheduler:
+    """Serves the latest frame of each stream, round-robin, with optional per-stream fps caps.
+
+    A stream is ready when it has a frame newer than the last one served and its fps cap allows another frame.
+    Each batch takes up to max_batch ready streams (0 for all), starting after the stream served last, so a slow or
+    capped stream never holds back the others and no stream is starved when batches are capped. Frames a stream
+    captures while it waits are replaced by newer ones, counted as skipped.
+    """
+
+    def __init__(self, sources='streams.txt', img_size=640, stride=32, fps=None, max_batch=0, vid_stride=1):
+        sources = Path(sources).read_text().rsplit() if os.path.isfile(sources) else [sources]
+        n = len(sources)
+        self.mode = 'stream'
+        self.sources = [clean_str(x) for x in sources]
+        self.img_size = img_size
+        self.stride = stride
+        self.vid_stride = vid_stride
+        fps = fps or [0]
+        self.fps = [float(fps[i] if i < len(fps) else fps[-1]) for i in range(n)]  # per-stream caps, 0 uncapped
+        self.max_batch = max_batch or n
+        self.ims, self.times = [None] * n, [0.0] * n  # latest frame and its capture time
+        self.read, self.served, self.skipped = [0] * n, [0] * n, [0] * n  # frames read, last served, skipped
+        self.batched = [0] * n  # frames served
+        self.due = [0.0] * n  # earliest time the next frame of each stream may be served
+        self.alive = [True] * n
+        self.next = 0  # round-robin start
+        self.stop = threading.Event()
+        self.cond = threading.Condition()
+        self.threads = []
+        for i, s in enumerate(sources):
+            st = f'{i + 1}/{n}: {s}... '
+            s = eval(s) if s.isnumeric() else s  # i.e. s = '0' local webcam
+            cap = cv2.VideoCapture(s)
+            assert cap.isOpened(), f'{st}Failed to open {s}'
+            w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = cap.get(cv2.CAP_PROP_FPS)  # warning: may return 0 or nan
+            fps = max((fps if math.isfinite(fps) else 0) % 100, 0) or 30  # 30 FPS fallback
+            cap_s = f', capped at {self.fps[i]:g} FPS' if self.fps[i] else ''
+            LOGGER.info(f'{st} Success ({w}x{h} at {fps:.2f} FPS{cap_s})')
+            self.threads.append(threading.Thread(target=self.update, args=(i, cap, s), daemon=True))
+        for t in self.threads:
+            t.start()
+        LOGGER.info('')  # newline
+
+    def update(self, i, cap, stream):
+        # Read stream i in a daemon thread, keeping only the latest frame
+        n = 0
+        while cap.isOpened() and not self.stop.is_set():
+            n += 1
+            if not cap.grab():
+                break
+            if n % self.vid_stride:
+                continue
+            success, im = cap.retrieve()
+            if not success:
+                LOGGER.warning(f'WARNING ⚠️ Stream {i} unresponsive, please check your IP camera connection.')
+                cap.open(stream)  # re-open stream if signal was lost
+                continue
+            with self.cond:
+                if self.read[i] > self.served[i]:
+                    self.skipped[i] += 1  # previous frame replaced before it was served
+                self.ims[i], self.times[i] = im, time.time()
+                self.read[i] += 1
+                self.cond.notify()
+        cap.release()
+        with self.cond:
+            self.alive[i] = False
+            self.cond.notify()
+
+    def __iter__(self):
+        n = len(self.sources)
+        while True:
+            with self.cond:
+                while True:
+                    now = time.time()
+                    order = [(self.next + k) % n for k in range(n)]
+                    new = [i for i in order if self.read[i] > self.served[i]]
+                    ready = [i for i in new if now >= self.due[i]]
+                    if ready or self.stop.is_set() or not (new or any(self.alive)):
+                        break
+                    wait = min((self.due[i] - now for i in new), default=0.1)
+                    self.cond.wait(timeout=max(wait, 1E-3))
+                if not ready:
+                    return
+                streams = ready[:self.max_batch]
+                im0s = [self.ims[i] for i in streams]
+                t = tuple(self.times[i] for i in streams)
+                frame = tuple(self.read[i] for i in streams)
+                for i in streams:
+                    self.served[i] = self.read[i]
+                    self.batched[i] += 1
+                    self.due[i] = max(self.due[i] + 1 / self.fps[i], now) if self.fps[i] else 0.0
+                self.next = (streams[-1] + 1) % n
+            im = np.stack([letterbox(x, self.img_size, stride=self.stride, auto=False)[0] for x in im0s])  # resize
+            im = np.ascontiguousarray(im[..., ::-1].transpose((0, 3, 1, 2)))  # BGR to RGB, BHWC to BCHW
+            k = len(streams)
+            yield dict(path=tuple(self.sources[i] for i in streams), im=im, im0s=im0s, vid_info=(None,) * k,
+                       s=tuple(f'{i}: ' for i in streams), frame=frame, mode=(self.mode,) * k, t0=min(t), t_capture=t,
+                       stream=tuple(streams))
+
+    def close(self):
+        self.stop.set()
+        with self.cond:
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join(timeout=1)
+
+    def stats(self):
+        return ', '.join(f'{i}: {self.batched[i]}/{self.read[i]} frames served, {self.skipped[i]} skipped'
+                         for i in range(len(self.sources)))
+
+    def __len__(self):
+        return len(self.sources)
@@ -0,0 +1,158 @@
+# YOLOv5 🚀 by Ultralytics, GPL-3.0 license
+"""
+Compare fast_nms.topk_nms with utils.general.non_max_suppression on recorded raw model outputs: latency per frame and
+whether both return the same detections.
+
+Usage:
+    $ python nms_benchmark.py --record --weights best_114514.pt --source video.mp4 --preds runs/nms/preds.pt
+    $ python nms_benchmark.py --preds runs/nms/preds.pt --topk 30 100 --out runs/nms/nms.json
+    $ python nms_benchmark.py --synthetic 200                                  # no weights, synthetic outputs
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
+
+from models.common import DetectMultiBackend
+from utils.dataloaders import LoadImages
+from utils.general import LOGGER, check_img_size, git_describe, non_max_suppression, print_args
+from utils.torch_utils import select_device, smart_inference_mode
+from fast_nms import topk_nms
+from telemetry import percentiles
+
+
+@smart_inference_mode()
+def record(weights, source, file, imgsz=(1280, 1280), frames=50, device='', half=False):
+    # Save the raw outputs (1, anchors, 5 + nc) of the first frames of source, fp16 on CPU to keep the file small
+    model = DetectMultiBackend(weights, device=select_device(device), fp16=half)
+    imgsz = check_img_size(imgsz, s=model.stride)
+    preds = []
+    for path, im, im0s, vid_cap, s in LoadImages(source, img_size=imgsz, stride=model.stride, auto=model.pt):
+        im = torch.from_numpy(im).to(model.device)
+        im = (im.half() if model.fp16 else im.float())[None] / 255
+        pred = model(im)
+        preds.append((pred[0] if isinstance(pred, (list, tuple)) else pred).half().cpu())
+        if len(preds) == frames:
+            break
+    Path(file).parent.mkdir(parents=True, exist_ok=True)
+    torch.save(dict(preds=preds, names=model.names, imgsz=imgsz), file)
+    LOGGER.info(f'{len(preds)} outputs of shape {tuple(preds[0].shape)} saved to {file}')
+
+
+def synthetic(n=100, anchors=100800, nc=8, objects=(0, 20), seed=0):
+    # Raw outputs with mostly background anchors and clusters of overlapping anchors on each object
+    g = torch.Generator().manual_seed(seed)
+    preds = []
+    for _ in range(n):
+        x = torch.rand(1, anchors, 5 + nc, generator=g)
+        x[..., :2] *= 1280
+        x[..., 2:4] = x[..., 2:4] * 64 + 8
+        x[..., 4] *= 0.2  # background objectness, below threshold
+        i = torch.randint(0, anchors, (20,), generator=g)
+        x[0, i, 4] = torch.rand(20, generator=g) * 0.4 + 0.2  # scattered weak candidates
+        k = int(torch.randint(objects[0], objects[1] + 1, (1,), generator=g))
+        for c in torch.randint(0, nc, (k,), generator=g).tolist():
+            i = torch.randint(0, anchors, (30,), generator=g)  # anchors on one object
+            x[0, i, :2] = torch.rand(2, generator=g) * 1280 + torch.randn(30, 2, generator=g) * 3
+            x[0, i, 2:4] = torch.rand(2, generator=g) * 200 + 20 + torch.randn(30, 2, generator=g) * 3
+            x[0, i, 4] = torch.rand(30, generator=g) * 0.5 + 0.5
+            x[0, i, 5 + c] = torch.rand(30, generator=g) * 0.3 + 0.7
+        preds.append(x)
+    return preds
+
+
+def same(a, b, eps=1E-3):
+    # True if both detection tensors hold the same boxes, ignoring the order of equal-confidence boxes
+    if a.shape != b.shape:
+        return False
+    a, b = a[a[:, :6].sum(1).argsort()], b[b[:, :6].sum(1).argsort()]
+    return bool(((a - b).abs() <= eps * (1 + a.abs())).all())
+
+
+def timed(f, pred, *args, **kwargs):
+    if pred.is_cuda:
+        torch.cuda.synchronize()
+    t = time.time()
+    y = f(pred, *args, **kwargs)[0]
+    if pred.is_cuda:
+        torch.cuda.synchronize()
+    return y, time.time() - t
+
+
+def compare(preds, conf_thres=0.25, iou_thres=0.45, max_det=1000, topk=100, device='', warmup=3):
+    # Run both NMS implementations on each output, returns a result dict
+    device = select_device(device)
+    t_ref, t_fast, equal, n_ref, n_fast = [], [], 0, 0, 0
+    for k, pred in enumerate(preds):
+        pred = pred.to(device).float()
+        ref, dt_ref = timed(non_max_suppression, pred, conf_thres, iou_thres, max_det=max_det)
+        fast, dt_fast = timed(topk_nms, pred, conf_thres, iou_thres, max_det=max_det, topk=topk)
+        if k >= warmup:
+            t_ref.append(dt_ref)
+            t_fast.append(dt_fast)
+        equal += same(ref, fast)
+        n_ref += len(ref)
+        n_fast += len(fast)
+    ref, fast = percentiles(t_ref), percentiles(t_fast)
+    return dict(topk=topk, frames=len(preds), frames_equal=equal, detections=n_ref, detections_fast=n_fast,
+                non_max_suppression_ms=ref, topk_nms_ms=fast,
+                speedup_p50=round(ref['p50'] / max(fast['p50'], 1E-6), 2) if ref and fast else None)
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--preds', type=str, default=ROOT / 'runs/nms/preds.pt', help='recorded outputs file')
+    parser.add_argument('--record', action='store_true', help='record --frames outputs of --source to --preds')
+    parser.add_argument('--synthetic', type=int, default=0, help='benchmark N synthetic outputs instead of --preds')
+    parser.add_argument('--weights', nargs='+', type=str, default=ROOT / 'best_114514.pt', help='model path(s)')
+    parser.add_argument('--source', type=str, default=ROOT / 'video.mp4', help='file/dir/glob to record')
+    parser.add_argument('--imgsz', '--img', '--img-size', nargs='+', type=int, default=[1280], help='inference h,w')
+    parser.add_argument('--frames', type=int, default=50, help='frames to record')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='confidence threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='NMS IoU threshold')
+    parser.add_argument('--max-det', type=int, default=1000, help='maximum detections per image')
+    parser.add_argument('--topk', nargs='+', type=int, default=[100], help='per-class top-k values to test')
+    parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--half', action='store_true', help='record with FP16 half-precision inference')
+    parser.add_argument('--out', type=str, default=ROOT / 'runs/nms/nms.json', help='JSON results file')
+    opt = parser.parse_args()
+    opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
+    return opt
+
+
+def main(opt):
+    if opt.record:
+        record(opt.weights, opt.source, opt.preds, opt.imgsz, opt.frames, opt.device, opt.half)
+        return
+    preds = synthetic(opt.synthetic) if opt.synthetic else torch.load(opt.preds)['preds']
+    results = []
+    for topk in opt.topk:
+        r = compare(preds, opt.conf_thres, opt.iou_thres, opt.max_det, topk, opt.device)
+        LOGGER.info(f"topk {topk}: {r['frames_equal']}/{r['frames']} frames equal "
+                    f"({r['detections_fast']}/{r['detections']} detections), p50/p95 ms "
+                    f"non_max_suppression {r['non_max_suppression_ms']['p50']:.2f}/"
+                    f"{r['non_max_suppression_ms']['p95']:.2f}, topk_nms {r['topk_nms_ms']['p50']:.2f}/"
+                    f"{r['topk_nms_ms']['p95']:.2f} ({r['speedup_p50']}x)")
+        results.append(r)
+    Path(opt.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(opt.out, 'w') as f:
+        json.dump(dict(git=git_describe(), preds='synthetic' if opt.synthetic else str(opt.preds),
+                       conf_thres=opt.conf_thres, iou_thres=opt.iou_thres, results=results), f, indent=2)
+    LOGGER.info(f'Results saved to {opt.out}')
+
+
+if __name__ == "__main__":
+    opt = parse_opt()
+    print_args(vars(opt))
+    main(opt)
@@ -0,0 +1,76 @@
+"""
+Box and label drawing for detect.py: boxes are drawn straight onto the frame and label tags are pasted from a cache of
+pre-rendered sprites, so annotating many boxes costs a few small copies instead of text rasterization per box.
+"""
+
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from utils.plots import check_pil_font
+
+
+class Overlay:
+    """Draws Annotator-style boxes and labels onto a frame in place, i.e. `Overlay()(im0, boxes, labels, colors)`.
+
+    Each label tag (text on a filled background) is rendered once per (text, colour, size) into a small sprite kept
+    in an LRU cache of n sprites, then copied into the frame above its box, or inside it at the top edge. Non-ASCII
+    labels are rendered with PIL like Annotator, once per sprite instead of converting the whole frame.
+    """
+
+    def __init__(self, line_width=None, n=1024):
+        self.line_width = line_width
+        self.n = n
+        self.sprites = OrderedDict()  # (label, colour, line width, font size): BGR sprite
+        self.fonts = {}  # size: PIL font
+        self.hits, self.misses = 0, 0
+
+    def sprite(self, label, color, lw, font_size):
+        key = label, color, lw, font_size
+        s = self.sprites.get(key)
+        if s is not None:
+            self.sprites.move_to_end(key)
+            self.hits += 1
+            return s
+        self.misses += 1
+        if label.isascii():  # cv2, Annotator.box_label metrics
+            tf = max(lw - 1, 1)  # font thickness
+            w, h = cv2.getTextSize(label, 0, fontScale=lw / 3, thickness=tf)[0]
+            s = np.empty((h + 3, w, 3), dtype=np.uint8)
+            s[:] = color
+            cv2.putText(s, label, (0, h + 1), 0, lw / 3, (255, 255, 255), thickness=tf, lineType=cv2.LINE_AA)
+        else:  # PIL
+            from PIL import Image, ImageDraw
+            if font_size not in self.fonts:
+                self.fonts[font_size] = check_pil_font('Arial.Unicode.ttf', font_size)
+            font = self.fonts[font_size]
+            w, h = font.getbbox(label)[2:]
+            image = Image.new('RGB', (w + 1, h + 1), tuple(color[::-1]))
+            ImageDraw.Draw(image).text((0, 0), label, fill=(255, 255, 255), font=font)
+            s = np.ascontiguousarray(np.asarray(image)[..., ::-1])  # RGB to BGR
+        self.sprites[key] = s
+        if len(self.sprites) > self.n:
+            self.sprites.popitem(last=False)  # least recently used
+        return s
+
+    def __call__(self, im, boxes, labels, colors):
+        # Draw xyxy boxes with labels (None for no label) and BGR colours onto im, returns im
+        h, w = im.shape[:2]
+        lw = self.line_width or max(round(sum(im.shape) / 2 * 0.003), 2)  # line width
+        font_size = max(round((h + w) / 2 * 0.035), 12)
+        for (x1, y1, x2, y2), label, color in zip(boxes, labels, colors):
+            x1, y1 = int(x1), int(y1)
+            cv2.rectangle(im, (x1, y1), (int(x2), int(y2)), color, thickness=lw)  # axis-aligned, AA is 3x slower
+            if not label:
+                continue
+            s = self.sprite(label, color, lw, font_size)
+            sh, sw = s.shape[:2]
+            top = y1 - sh if y1 >= sh else y1  # outside the box if it fits
+            a, b, c, d = max(top, 0), min(top + sh, h), max(x1, 0), min(x1 + sw, w)  # clipped to the frame
+            if a < b and c < d:
+                im[a:b, c:d] = s[a - top:b - top, c - x1:d - x1]
+        return im
+
+    def __str__(self):
+        return f'{len(self.sprites)} label sprites cached, {self.hits}/{self.hits + self.misses} labels from cache'
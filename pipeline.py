@@ -0,0 +1,155 @@
+"""
+Threaded stage pipeline for `detect.py --pipeline` and latency-deadline frame scheduling for `--latency-budget`.
+
+Usage:
+    for batch in Pipeline(dataset, (preprocess, inference, postprocess), maxsize=4, policy='block'):
+        sink(batch)
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+
+from telemetry import percentiles
+
+_END = object()  # end-of-stream sentinel
+
+
+class Pipeline:
+    # Runs each stage in its own thread, connected by bounded queues. Items reach the consumer in source order.
+    # A stage may return None to drop an item, i.e. a frame skipped by DeadlineScheduler
+    def __init__(self, source, stages, maxsize=4, policy='block'):
+        assert stages, 'Pipeline requires at least one stage'
+        assert policy in ('block', 'drop'), f"invalid pipeline policy '{policy}', valid policies are 'block', 'drop'"
+        self.policy = policy  # 'block' waits for space, 'drop' discards the oldest waiting frame before inference
+        self.count = 0  # items delivered to the consumer
+        self.dropped = 0  # items discarded by the 'drop' policy
+        self.error = None  # first exception raised inside a stage thread
+        self.stop = threading.Event()
+        self.queues = [queue.Queue(maxsize=max(maxsize, 1)) for _ in stages]  # queues[i] holds output of stages[i]
+        self.threads = [threading.Thread(target=self._source, args=(source, stages[0]), daemon=True)]
+        self.threads += [
+            threading.Thread(target=self._stage, args=(f, qi, qo), daemon=True)
+            for f, qi, qo in zip(stages[1:], self.queues, self.queues[1:])]
+
+    def __iter__(self):
+        for t in self.threads:
+            t.start()
+        try:
+            while True:
+                x = self._get(self.queues[-1])
+                if x is _END:
+                    break
+                self.count += 1
+                yield x
+        finally:
+            self.stop.set()  # release any stage still blocked on a queue
+            for t in self.threads:
+                t.join()
+        if self.error is not None:
+            raise self.error
+
+    def _source(self, source, fn):
+        # Read source items and apply the first stage, i.e. capture + pre-process
+        q = self.queues[0]
+        try:
+            for x in source:
+                if self.stop.is_set():
+                    break
+                x = fn(x)
+                if x is None:
+                    continue
+                if self.policy == 'drop':
+                    self._put_drop_oldest(q, x)
+                else:
+                    self._put(q, x)
+        except Exception as e:
+            self.error = self.error or e
+        finally:
+            self._put(q, _END)
+
+    def _stage(self, fn, qi, qo):
+        # Apply fn to every item of qi and forward results to qo
+        try:
+            while True:
+                x = self._get(qi)
+                if x is _END:
+                    break
+                x = fn(x)
+                if x is not None:
+                    self._put(qo, x)
+        except Exception as e:
+            self.error = self.error or e
+        finally:
+            self._put(qo, _END)
+
+    def _put(self, q, x):
+        while not self.stop.is_set():
+            try:
+                q.put(x, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _put_drop_oldest(self, q, x):
+        while not self.stop.is_set():
+            try:
+                q.put_nowait(x)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()  # discard oldest
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+
+class DeadlineScheduler:
+    """Skips frames that cannot be processed within a latency budget, i.e. `if scheduler.admit(t_capture): ...`
+
+    The expected processing cost is an exponential moving average of the measured stage times. A frame is skipped
+    when its age plus that cost would exceed the budget, unless it is still fresh: when the budget is unreachable
+    only the newest frames are processed instead of none.
+    """
+
+    def __init__(self, budget, alpha=0.2, fresh=0.005, n=1000):
+        self.budget = budget  # latency budget (s)
+        self.alpha = alpha  # EMA smoothing factor
+        self.fresh = fresh  # frames younger than this (s) are always admitted
+        self.cost = 0.0  # expected processing time from admission to result (s)
+        self.processed, self.skipped = 0, 0
+        self.latency = deque(maxlen=n)  # recent capture-to-result latencies (s)
+        self.lock = threading.Lock()
+
+    def admit(self, t):
+        # Return True if a frame captured at time t (time.time()) can still meet the deadline
+        age = time.time() - t
+        if age > self.fresh and age + self.cost > self.budget:
+            with self.lock:
+                self.skipped += 1
+            return False
+        return True
+
+    def update(self, t, cost):
+        # Record a result for a frame captured at time t, with measured processing cost (s)
+        with self.lock:
+            self.processed += 1
+            self.cost = cost if self.processed == 1 else self.alpha * cost + (1 - self.alpha) * self.cost
+            self.latency.append(time.time() - t)
+
+    def __str__(self):
+        n = self.processed + self.skipped
+        if not self.latency:
+            return f'no frames processed, {self.skipped} skipped'
+        p = percentiles(self.latency)
+        return (f"{p['p50']:.1f}ms p50, {p['p95']:.1f}ms p95, {p['max']:.1f}ms max latency "
+                f'(budget {self.budget * 1E3:.0f}ms), {self.skipped}/{n} frames skipped ({self.skipped / n:.1%})')
@@ -0,0 +1,54 @@
+"""
+Structured detection records shared by detect.run(), the GUI and the actuator output.
+
+Usage:
+    tables = LabelTables(model.names)
+    records = make_records(det, tables, ids, numbers, stream=0, frame=12)
+    records[records['category'] == 1]  # hazardous items
+"""
+
+import numpy as np
+
+RECORD = np.dtype([
+    ('cls', np.int16),  # model class id
+    ('category', np.int8),  # rubbish category, index into CATEGORIES
+    ('code', np.uint8),  # sorting actuator code
+    ('conf', np.float32),  # confidence
+    ('xyxy', np.float32, 4),  # box in original image pixels
+    ('track', np.int32),  # tracker id, 0 if not tracked
+    ('number', np.int32),  # tracked per-class count number, 0 if unconfirmed or not tracked
+    ('stream', np.int16),  # source stream index
+    ('frame', np.int32),  # frame number within the source
+])
+
+CATEGORIES = ('recyclable', 'hazardous', 'kitchen', 'other')  # same order as the GUI tally labels
+CATEGORY_OF = {'can': 0, 'bottle': 0, 'battery': 1, 'red_carrot': 2, 'white_carrot': 2, 'potato': 2}  # else 'other'
+CODE_OF = {'battery': 0x00, 'bottle': 0x01, 'potato': 0x02, 'carrot': 0x03, 'red_carrot': 0x03, 'white_carrot': 0x03}
+OTHER_CODE = 0x04
+
+
+class LabelTables:
+    # class id -> category / actuator code lookup tables, built once from model.names (list or {id: name} dict)
+    def __init__(self, names):
+        self.names = [names[i] for i in range(len(names))]
+        self.category = np.array([CATEGORY_OF.get(x, len(CATEGORIES) - 1) for x in self.names], dtype=np.int8)
+        self.code = np.array([CODE_OF.get(x, OTHER_CODE) for x in self.names], dtype=np.uint8)
+
+
+def make_records(det, tables, ids=None, numbers=None, stream=0, frame=0):
+    # Build a RECORD array from det (n, 6) [xyxy, conf, cls] (tensor or array) and optional tracker ids/numbers
+    det = np.asarray(det.cpu() if hasattr(det, 'cpu') else det, dtype=np.float32).reshape(-1, 6)
+    cls = det[:, 5].astype(int)
+    r = np.zeros(len(det), dtype=RECORD)
+    r['cls'] = cls
+    r['category'] = tables.category[cls]
+    r['code'] = tables.code[cls]
+    r['conf'] = det[:, 4]
+    r['xyxy'] = det[:, :4]
+    if ids is not None:
+        r['track'] = ids
+    if numbers is not None:
+        r['number'] = numbers
+    r['stream'] = stream
+    r['frame'] = frame
+    return r
@@ -0,0 +1,159 @@
+# YOLOv5 🚀 by Ultralytics, GPL-3.0 license
+"""
+Offline detection sharded across processes: a video is split into frame ranges, a directory or glob into contiguous
+groups of files. Each worker loads its own model once and runs detect.py run() on its shards with a limited number of
+threads, then the label files, crops, saved images/videos and per-class counts are merged into one save_dir in shard
+order, so the result does not depend on which worker finished first.
+
+Usage:
+    $ python shard.py --workers 8 --threads 2 --source day.mp4 --save-txt --nosave   # any detect.py options
+    $ python shard.py --workers 16 --source 'archive/**/*.jpg' --save-crop
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
+
+from utils.dataloaders import IMG_FORMATS, VID_FORMATS
+from utils.general import LOGGER, colorstr, increment_path
+
+MODEL = None  # per-worker DetectMultiBackend
+
+
+def files_of(source):
+    # Sorted image/video files of a file, directory or glob, as detect.py LoadImages lists them
+    p = str(Path(source).resolve())
+    if '*' in p:
+        files = sorted(glob.glob(p, recursive=True))  # glob
+    elif os.path.isdir(p):
+        files = sorted(glob.glob(os.path.join(p, '*.*')))  # dir
+    else:
+        files = [p]  # file
+    return [f for f in files if f.split('.')[-1].lower() in IMG_FORMATS + VID_FORMATS]
+
+
+def plan(source, shards, vid_stride=1):
+    # Split source into shards: [(source, frame_range or None), ...] in output order
+    files = files_of(source)
+    if len(files) == 1 and files[0].split('.')[-1].lower() in VID_FORMATS:  # one video, split by frame ranges
+        cap = cv2.VideoCapture(files[0])
+        n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) / vid_stride)
+        cap.release()
+        edges = [round(n * k / shards) for k in range(shards + 1)]
+        return [(files[0], (a, b)) for a, b in zip(edges, edges[1:]) if b > a]
+    edges = [round(len(files) * k / shards) for k in range(shards + 1)]
+    return [(files[a:b], None) for a, b in zip(edges, edges[1:]) if b > a]
+
+
+def init_worker(options, threads):
+    # Process pool initializer: limit threads, load the model once per worker
+    global MODEL
+    import torch
+    from models.common import DetectMultiBackend
+    from utils.general import check_img_size
+    from utils.torch_utils import select_device
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    device = select_device(options['device'])
+    MODEL = DetectMultiBackend(options['weights'], device=device, dnn=options['dnn'], data=options['data'],
+                               fp16=options['half'])
+    MODEL.warmup(imgsz=(1, 3, *check_img_size(options['imgsz'], s=MODEL.stride)))
+
+
+def work(job):
+    # Run detect.py on one shard into its own directory, returns run()'s summary
+    from detect import run
+    k, source, frame_range, options, shard_dir = job
+    if isinstance(source, list):  # group of files, link them into one directory (names are kept)
+        src = Path(shard_dir) / f'{k}.src'
+        src.mkdir(parents=True, exist_ok=True)
+        for i, f in enumerate(source):
+            (src / f'{i:06d}_{Path(f).name}').symlink_to(f)  # prefix keeps the original order and unique names
+        source = src
+    options = dict(options, source=str(source), frame_range=frame_range, project=shard_dir, name=str(k),
+                   exist_ok=True, view_img=False)
+    return run(model=MODEL, **options)
+
+
+def merge(save_dir, summaries, split_video):
+    # Move shard outputs into save_dir in shard order, renaming deterministically on collisions
+    save_dir = Path(save_dir)
+    for k, r in enumerate(summaries):
+        shard = Path(r['save_dir'])
+        for f in sorted(x for x in shard.rglob('*') if x.is_file()):
+            rel = f.relative_to(shard)
+            name = rel.name
+            if split_video and f.suffix == '.mp4':  # each shard encoded a part of the video
+                name = f'{f.stem}_part{k}.mp4'
+            elif not split_video and name[:6].isdigit() and name[6:7] == '_':  # strip work() link prefix
+                name = name[7:]
+            dst = save_dir / rel.parent / name
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            n = 0
+            while dst.exists():  # i.e. same file names in different source directories
+                n += 1
+                dst = save_dir / rel.parent / f'{Path(name).stem}_shard{k}_{n}{Path(name).suffix}'
+            shutil.move(str(f), dst)
+    totals = dict(seen=0, detections={}, tracked={})
+    for r in summaries:
+        totals['seen'] += r['seen']
+        for key in 'detections', 'tracked':
+            for c, n in r[key].items():
+                totals[key][c] = totals[key].get(c, 0) + n
+    for key in 'detections', 'tracked':
+        totals[key] = dict(sorted(totals[key].items()))
+    return totals
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description='shard.py options, all other options are passed to detect.py')
+    parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 1) // 2, 1), help='worker processes')
+    parser.add_argument('--threads', type=int, default=2, help='torch/OpenCV threads per worker')
+    parser.add_argument('--shards', type=int, default=0, help='shards, default 4 per worker')
+    opt, rest = parser.parse_known_args()
+    import detect
+    sys.argv = sys.argv[:1] + rest
+    return opt, detect.parse_opt()
+
+
+def main(opt, detect_opt):
+    t = time.time()
+    options = vars(detect_opt)
+    for k in 'weights', 'data', 'project':
+        options[k] = [str(x) for x in options[k]] if isinstance(options[k], list) else str(options[k])
+    save_dir = increment_path(Path(options['project']) / options['name'], exist_ok=options['exist_ok'])
+    shard_dir = save_dir / 'shards'
+    jobs = plan(options['source'], opt.shards or 4 * opt.workers, options['vid_stride'])
+    LOGGER.info(f"{len(jobs)} shards of {options['source']} on {opt.workers} workers x {opt.threads} threads")
+    jobs = [(k, source, frame_range, options, str(shard_dir)) for k, (source, frame_range) in enumerate(jobs)]
+    ctx = multiprocessing.get_context('spawn')  # CUDA-safe, fresh interpreter per worker
+    with ctx.Pool(opt.workers, initializer=init_worker, initargs=(options, opt.threads)) as pool:
+        summaries = pool.map(work, jobs, chunksize=1)  # results in shard order
+    totals = merge(save_dir, summaries, split_video=jobs[0][2] is not None)
+    shutil.rmtree(shard_dir)
+    with open(save_dir / 'counts.json', 'w') as f:
+        json.dump(totals, f, indent=2)
+    LOGGER.info(f"{totals['seen']} images in {time.time() - t:.1f}s ({totals['seen'] / (time.time() - t):.1f} FPS), "
+                f"detections: {totals['detections'] or 'none'}")
+    if jobs[0][2] is not None and totals['tracked']:
+        LOGGER.info('Tracked counts of a split video may count objects crossing shard boundaries twice')
+    LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}")
+
+
+if __name__ == "__main__":
+    opt, detect_opt = parse_opt()
+    main(opt, detect_opt)
@@ -0,0 +1,253 @@
+"""
+Background output sinks for detect.py results.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+def labels_text(x):
+    # Format label rows x (n, k) as '%g'-separated lines with a single string operation
+    n, k = x.shape
+    return ((('%g ' * k).rstrip() + '\n') * n) % tuple(x.ravel().tolist())
+
+
+class LabelWriter:
+    # Appends --save-txt label text from a background thread, opening each file once per drained batch of writes
+    def __init__(self, maxsize=256):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, file, text):
+        self.queue.put((file, text))
+
+    def close(self):
+        # Flush pending labels and stop the writer thread
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        done = False
+        while not done:
+            items = [self.queue.get()]
+            while True:  # drain everything already queued
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            buffer = {}
+            for item in items:
+                if item is None:
+                    done = True
+                else:
+                    buffer.setdefault(item[0], []).append(item[1])
+            try:
+                for file, texts in buffer.items():
+                    with open(file, 'a') as f:
+                        f.write(''.join(texts))
+            except OSError as e:
+                self.error = self.error or e
+
+
+class VideoSink:
+    # Encodes one output stream (mp4 video or image sequence) in a worker thread fed by a bounded queue
+    def __init__(self, maxsize=32, drop=False):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.drop = drop  # drop frames when the queue is full (live streams) instead of blocking the caller
+        self.written, self.dropped, self.delayed = 0, 0, 0  # frames encoded, discarded, and enqueued after a wait
+        self.writer = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def open(self, file, fps, size):
+        # Start a new video file, the previous writer is released by the worker once its frames are encoded
+        self._put(('open', file, fps, size), force=True)
+
+    def write(self, im):
+        self._put(('frame', im))
+
+    def imwrite(self, file, im):
+        self._put(('image', file, im))
+
+    def close(self):
+        # Encode all pending frames, release the writer and stop the worker thread
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        return f'{self.written} frames written, {self.dropped} dropped, {self.delayed} delayed'
+
+    def _put(self, item, force=False):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if self.drop and not force:
+                self.dropped += 1
+                return
+            self.delayed += 1
+            self.queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == 'open':
+                    self._release()
+                    _, file, fps, size = item
+                    self.writer = cv2.VideoWriter(file, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+                elif item[0] == 'frame':
+                    self.writer.write(item[1])
+                    self.written += 1
+                else:  # 'image'
+                    cv2.imwrite(item[1], item[2])
+                    self.written += 1
+            except Exception as e:
+                self.error = self.error or e
+        self._release()
+
+    def _release(self):
+        if self.writer is not None:
+            self.writer.release()  # release previous video writer
+            self.writer = None
+
+
+def crop_boxes(xyxy, shape, gain=1.02, pad=10, square=False):
+    # save_one_box() crop regions of all boxes at once: (n, 4) int xyxy, clipped to an image of shape (h, w, ...)
+    b = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    c, wh = (b[:, :2] + b[:, 2:]) / 2, b[:, 2:] - b[:, :2]
+    if square:
+        wh[:] = wh.max(1, keepdims=True)  # attempt rectangle to square
+    wh = wh * gain + pad  # box wh * gain + pad
+    b = np.concatenate((c - wh / 2, c + wh / 2), 1).astype(int)
+    b[:, 0::2] = b[:, 0::2].clip(0, shape[1])
+    b[:, 1::2] = b[:, 1::2].clip(0, shape[0])
+    return b
+
+
+def crop_views(im, xyxy, **kwargs):
+    # Crops of im as views (no pixels copied), one per xyxy box
+    return [im[y1:y2, x1:x2] for x1, y1, x2, y2 in crop_boxes(xyxy, im.shape, **kwargs).tolist()]
+
+
+def dhash(im):
+    # 64-bit difference hash of a BGR image, near-identical crops differ in a few bits
+    x = cv2.resize(cv2.cvtColor(im, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+    return np.packbits(x[:, 1:] > x[:, :-1]).view(np.uint64)[0]
+
+
+class CropSink:
+    """Writes --save-crop jpgs from a pool of worker threads and keeps the latest crops in memory.
+
+    Views are copied on put(), so queued crops neither pin whole frames nor change when the frame is drawn on.
+    Duplicates are not written: a second crop of the same (stream, track), or without a track one whose dhash is
+    within `distance` bits of a crop of its class in the previous frame of its stream (static scenes). Hashes are
+    never compared across streams, within a frame or over gaps, so distinct low-texture objects are all written. The
+    last `ring` crops, duplicates included, are available from latest(), i.e. for a UI or a downstream classifier.
+    """
+
+    def __init__(self, save_dir=None, workers=2, maxsize=256, ring=64, distance=4, quality=95,
+                 drop=False):
+        self.save_dir = Path(save_dir) if save_dir else None  # None to keep crops in memory only
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.ring = deque(maxlen=ring)
+        self.distance = distance
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        if hasattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR'):  # OpenCV >= 4.5.5, no chroma subsampling like save_one_box
+            self.params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444]
+        self.drop = drop  # drop crops when the queue is full (live streams) instead of blocking the caller
+        self.tracks = set()  # (stream, track) written
+        self.hashes = {}  # (stream, class): [frame, dhashes of frame, dhashes of frame - 1]
+        self.dirs = set()  # directories created
+        self.lock = threading.Lock()
+        self.written, self.duplicates, self.dropped = 0, 0, 0
+        self.error = None
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers if save_dir else 0)]
+        for t in self.threads:
+            t.start()
+
+    def put(self, crop, file, cls, conf=0.0, track=0, stream=0, frame=0):
+        # Add a crop, file is relative to save_dir
+        if crop.base is not None:  # view of a frame
+            crop = crop.copy()
+        item = dict(crop=crop, file=file, cls=cls, conf=conf, track=track, stream=stream, frame=frame, t=time.time())
+        with self.lock:
+            self.ring.append(item)
+        if self.save_dir is None:
+            return
+        if self.duplicate(crop, cls, track, stream, frame):
+            self.duplicates += 1
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if self.drop:
+                self.dropped += 1
+            else:
+                self.queue.put(item)
+
+    def duplicate(self, crop, cls, track, stream, frame):
+        if track > 0:
+            if (stream, track) in self.tracks:
+                return True
+            self.tracks.add((stream, track))
+            return False
+        if not crop.size:
+            return True
+        h = dhash(crop)
+        last = self.hashes.setdefault((stream, cls), [frame, [], []])
+        if last[0] != frame:  # new frame, its predecessor's hashes only count if it was the previous one
+            last[:] = frame, [], last[1] if last[0] == frame - 1 else []
+        last[1].append(h)  # duplicates included, a static object stays a duplicate in every frame
+        if last[2]:
+            bits = np.unpackbits((np.array(last[2], dtype=np.uint64) ^ h).view(np.uint8).reshape(-1, 8), axis=1)
+            return bool(bits.sum(1).min() <= self.distance)
+        return False
+
+    def latest(self, n=None):
+        # Newest crops last, as dicts of crop, file, cls, conf, track, stream, frame and t (time added)
+        with self.lock:
+            items = list(self.ring)
+        return items[-n:] if n else items
+
+    def close(self):
+        # Write all pending crops and stop the workers
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        return f'{self.written} crops written, {self.duplicates} duplicates skipped, {self.dropped} dropped'
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                file = self.save_dir / item['file']
+                if file.parent not in self.dirs:
+                    file.parent.mkdir(parents=True, exist_ok=True)
+                    self.dirs.add(file.parent)
+                cv2.imwrite(str(file), item['crop'], self.params)
+                with self.lock:
+                    self.written += 1
+            except Exception as e:
+                self.error = self.error or e
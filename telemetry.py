@@ -0,0 +1,213 @@
+"""
+Run-time metrics and profiling for detect.py: named stage timers, gauges and rates, exported over HTTP
+(`--metrics-port`, Prometheus text at /metrics, JSON at /metrics.json) or dumped to a JSON file (`--metrics-file`),
+and a `--profile torch|cprofile` switch that traces a window of frames.
+
+Usage:
+    metrics = Metrics()
+    with metrics.time('inference'):
+        pred = model(im)
+    metrics.gauge('queue', q.qsize)  # callables are read at export time
+    metrics.tick('frames')
+    MetricsServer(metrics, port=9090)
+"""
+
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+def percentiles(x, q=(50, 95, 99)):
+    # Summary of a list of seconds in ms: mean, nearest-rank percentiles q and max, {} if empty
+    x = sorted(x)
+    if not x:
+        return {}
+    p = {f'p{k}': round(x[min(int(len(x) * k / 100), len(x) - 1)] * 1E3, 3) for k in q}
+    return dict(mean=round(sum(x) / len(x) * 1E3, 3), **p, max=round(x[-1] * 1E3, 3))
+
+
+class Metrics:
+    """Thread-safe rolling timers (last n samples per name), gauges and event rates.
+
+    Timers and gauges are created on first use, so stages only need a name. Rates count events over the last
+    `window` seconds, i.e. frames per second.
+    """
+
+    def __init__(self, n=1000, window=5.0):
+        self.n = n
+        self.window = window
+        self.timers = {}  # name: deque of seconds
+        self.totals = {}  # name: [count, sum of seconds]
+        self.gauges = {}  # name: value or callable
+        self.events = {}  # name: deque of (time, count)
+        self.lock = threading.Lock()
+        self.t0 = time.time()
+
+    @contextmanager
+    def time(self, name):
+        t = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - t)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.timers:
+                self.timers[name], self.totals[name] = deque(maxlen=self.n), [0, 0.0]
+            self.timers[name].append(seconds)
+            total = self.totals[name]
+            total[0] += 1
+            total[1] += seconds
+
+    def gauge(self, name, value):
+        # Set a gauge to a value, or to a callable read at export time (i.e. queue.qsize)
+        self.gauges[name] = value
+
+    def tick(self, name, n=1):
+        t = time.time()
+        with self.lock:
+            events = self.events.setdefault(name, deque())
+            events.append((t, n))
+            while events and events[0][0] < t - self.window:
+                events.popleft()
+
+    def snapshot(self):
+        # Current values as a dict: timers (ms percentiles of the rolling window, lifetime totals), gauges, rates (/s)
+        t = time.time()
+        with self.lock:
+            timers = {k: (list(v), *self.totals[k]) for k, v in self.timers.items()}
+            events = {k: list(v) for k, v in self.events.items()}
+        s = dict(uptime=round(t - self.t0, 3), timers={}, gauges={}, rates={})
+        for k, (x, count, total) in timers.items():
+            if x:
+                s['timers'][k] = dict(count=count, total_s=round(total, 3), **percentiles(x))
+        for k, v in list(self.gauges.items()):
+            try:
+                s['gauges'][k] = v() if callable(v) else v
+            except Exception:  # source already closed
+                pass
+        for k, v in events.items():
+            v = [n for ti, n in v if ti >= t - self.window]
+            s['rates'][k] = round(sum(v) / min(self.window, max(t - self.t0, 1E-3)), 2)
+        return s
+
+    def prometheus(self, prefix='detect'):
+        # Snapshot in Prometheus text exposition format
+        s, lines = self.snapshot(), []
+        for k, v in s['timers'].items():
+            for q in (50, 95, 99):
+                lines.append(f'{prefix}_stage_ms{{stage="{k}",quantile="0.{q}"}} {v[f"p{q}"]}')
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{k}"}} {v["total_s"]}')
+            lines.append(f'{prefix}_stage_count{{stage="{k}"}} {v["count"]}')
+        lines += [f'{prefix}_{k} {v}' for k, v in s['gauges'].items() if isinstance(v, (int, float))]
+        lines += [f'{prefix}_{k}_per_second {v}' for k, v in s['rates'].items()]
+        lines.append(f'{prefix}_uptime_seconds {s["uptime"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    # Serves Metrics on http://host:port/metrics (Prometheus text) and /metrics.json from a daemon thread
+    def __init__(self, metrics, port=9090, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/metrics.json'):
+                    body, kind = json.dumps(metrics.snapshot()).encode(), 'application/json'
+                elif self.path.startswith('/metrics'):
+                    body, kind = metrics.prometheus().encode(), 'text/plain; version=0.0.4'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # quiet
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsDump:
+    # Writes Metrics snapshots as JSON to file every interval seconds and on close(), replacing the file atomically
+    def __init__(self, metrics, file, interval=10.0):
+        self.metrics = metrics
+        self.file = Path(file)
+        self.interval = interval
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.dump()
+
+    def dump(self):
+        tmp = self.file.with_suffix(self.file.suffix + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.metrics.snapshot(), f, indent=2)
+        os.replace(tmp, self.file)
+
+    def _run(self):
+        while not self.stop.wait(self.interval):
+            self.dump()
+
+
+class Profiler:
+    """Profiles frames [skip, skip + frames) with torch.profiler or cProfile, call step() once per frame.
+
+    torch traces are saved as Chrome traces (chrome://tracing, https://ui.perfetto.dev), cProfile as .prof stats
+    (python -m pstats, snakeviz). Both only record the thread that calls step(), profile single-threaded runs.
+    """
+
+    def __init__(self, kind, save_dir, frames=100, skip=10):
+        assert kind in ('torch', 'cprofile'), f"invalid profiler '{kind}', valid profilers are 'torch', 'cprofile'"
+        self.kind = kind
+        self.file = Path(save_dir) / ('trace.json' if kind == 'torch' else 'profile.prof')
+        self.start, self.end = skip, skip + frames
+        self.count = 0
+        self.profiler = None
+        self.saved = None  # file once written
+
+    def step(self, n=1):
+        if self.saved:
+            return
+        self.count += n
+        if self.profiler is None and self.count > self.start:
+            if self.kind == 'torch':
+                import torch.profiler
+                self.profiler = torch.profiler.profile(record_shapes=True, with_stack=True)
+                self.profiler.__enter__()
+            else:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+        elif self.profiler is not None and self.count > self.end:
+            self.close()
+
+    def close(self):
+        # Stop and save, i.e. when the source ends inside the profiling window
+        if self.profiler is None or self.saved:
+            return
+        if self.kind == 'torch':
+            self.profiler.__exit__(None, None, None)
+            self.profiler.export_chrome_trace(str(self.file))
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(str(self.file))
+        self.saved = self.file
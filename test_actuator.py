@@ -0,0 +1,54 @@
+"""
+Round trip of actuator frames through a pty, the raw tty path used without pyserial.
+
+Usage:
+    $ python -m pytest test_actuator.py
+"""
+
+import os
+import pty
+import termios
+
+import pytest
+
+import actuator
+from actuator import ActuatorSender, decode
+
+
+def read(fd, n):
+    # Read exactly n bytes from fd
+    data = b''
+    while len(data) < n:
+        data += os.read(fd, n - len(data))
+    return data
+
+
+def test_pty_round_trip(monkeypatch):
+    monkeypatch.setattr(actuator, 'serial', None)  # raw tty path even if pyserial is installed
+    master, slave = pty.openpty()
+    try:
+        port = os.ttyname(slave)
+        attrs = termios.tcgetattr(slave)
+        attrs[4] = attrs[5] = termios.B9600  # left at another rate by a previous user
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        sender = ActuatorSender(port, baudrate=115200)
+        codes = [0x01, 0x22, 0xFF]
+        for code in codes:
+            sender.send(code, t=1000.5)
+        sender.close()
+        attrs = termios.tcgetattr(slave)
+        assert attrs[4] == attrs[5] == termios.B115200
+        assert not attrs[3] & termios.ICANON  # raw mode
+        size = actuator.HEADER.size + 1
+        data = read(master, size * len(codes))
+        frames = [decode(data[i:i + size]) for i in range(0, len(data), size)]
+        assert frames == [(seq, 1000500, code) for seq, code in enumerate(codes)]
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def test_unsupported_baud(monkeypatch):
+    monkeypatch.setattr(actuator, 'serial', None)
+    with pytest.raises(ValueError):
+        ActuatorSender('/dev/null', baudrate=12345)
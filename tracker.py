@@ -0,0 +1,128 @@
+"""
+SORT-style multi-object tracker for `detect.py --track`: Kalman-filtered boxes matched to detections by IoU.
+
+Usage:
+    tracker = Sort()
+    det, ids, numbers = tracker.update(det)  # det (n, 6) [xyxy, conf, cls] in image pixels
+    det, ids, numbers = tracker.predict()  # frames without detection
+"""
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def xyxy2xysr(x):
+    # Convert nx4 boxes from [x1, y1, x2, y2] to [x, y, s, r] where xy=center, s=area, r=aspect ratio w/h
+    w, h = x[:, 2] - x[:, 0], x[:, 3] - x[:, 1]
+    return np.stack((x[:, 0] + w / 2, x[:, 1] + h / 2, w * h, w / np.maximum(h, 1E-6)), 1)
+
+
+def xysr2xyxy(x):
+    # Convert nx4 boxes from [x, y, s, r] to [x1, y1, x2, y2]
+    w = np.sqrt(np.maximum(x[:, 2] * x[:, 3], 0))
+    h = x[:, 2] / np.maximum(w, 1E-6)
+    return np.stack((x[:, 0] - w / 2, x[:, 1] - h / 2, x[:, 0] + w / 2, x[:, 1] + h / 2), 1)
+
+
+def box_iou(box1, box2, eps=1E-7):
+    # IoU of nx4 and mx4 xyxy boxes, returns nxm matrix
+    lt = np.maximum(box1[:, None, :2], box2[None, :, :2])
+    rb = np.minimum(box1[:, None, 2:], box2[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(2)
+    area1 = (box1[:, 2:] - box1[:, :2]).prod(1)
+    area2 = (box2[:, 2:] - box2[:, :2]).prod(1)
+    return inter / (area1[:, None] + area2[None] - inter + eps)
+
+
+class Track:
+    # Constant-velocity Kalman filter on box state [x, y, s, r, vx, vy, vs] with measurement [x, y, s, r]
+    F = np.eye(7)
+    F[:3, 4:] = np.eye(3)  # state transition
+    H = np.eye(4, 7)  # measurement function
+    Q = np.diag([1, 1, 1, 1, 1E-2, 1E-2, 1E-4])  # process noise
+    R = np.diag([1, 1, 10, 10])  # measurement noise
+
+    def __init__(self, det, id):
+        self.x = np.zeros(7)
+        self.x[:4] = xyxy2xysr(det[None, :4])[0]
+        self.P = np.diag([10, 10, 10, 10, 1E4, 1E4, 1E4])  # high uncertainty for unobserved velocities
+        self.id = id  # unique track id
+        self.conf, self.cls = det[4], det[5]
+        self.hits, self.misses = 1, 0  # matched detections, consecutive detection frames without a match
+        self.number = 0  # per-class count number, assigned once the track is confirmed
+
+    def predict(self):
+        if self.x[2] + self.x[6] <= 0:  # keep area positive
+            self.x[6] = 0
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+
+    def update(self, det):
+        y = xyxy2xysr(det[None, :4])[0] - self.H @ self.x  # residual
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)  # Kalman gain
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+        self.conf, self.cls = det[4], det[5]
+        self.hits += 1
+        self.misses = 0
+
+    @property
+    def xyxy(self):
+        return xysr2xyxy(self.x[None, :4])[0]
+
+
+class Sort:
+    """Assigns stable ids to detections and counts each object once, when its track is confirmed.
+
+    Tracks are matched to same-class detections by IoU with the Hungarian algorithm, confirmed after min_hits matches
+    and dropped after max_age detection frames without a match. predict() advances tracks on frames where detection
+    is skipped. counts holds the number of confirmed tracks per class, each track's number is its place in that tally.
+    """
+
+    def __init__(self, max_age=5, min_hits=3, iou_thres=0.3):
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_thres = iou_thres
+        self.tracks = []
+        self.next_id = 1
+        self.counts = {}  # class: confirmed tracks
+
+    def update(self, det):
+        # Match det (n, 6) [xyxy, conf, cls], returns det, track ids (n,) and count numbers (n,), 0 if unconfirmed
+        det = np.asarray(det, dtype=np.float32).reshape(-1, 6)
+        for t in self.tracks:
+            t.predict()
+        matches, track_of = [], [None] * len(det)
+        if len(det) and self.tracks:
+            iou = box_iou(det[:, :4], np.stack([t.xyxy for t in self.tracks]))
+            iou[det[:, 5:6] != np.array([t.cls for t in self.tracks])[None]] = 0  # no cross-class matches
+            matches = [(i, j) for i, j in zip(*linear_sum_assignment(-iou)) if iou[i, j] >= self.iou_thres]
+        for i, j in matches:
+            self.tracks[j].update(det[i])
+            track_of[i] = self.tracks[j]
+        matched = {j for _, j in matches}
+        for j, t in enumerate(self.tracks):
+            if j not in matched:
+                t.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_age]
+        for i, t in enumerate(track_of):
+            if t is None:  # new track
+                t = track_of[i] = Track(det[i], self.next_id)
+                self.next_id += 1
+                self.tracks.append(t)
+            if not t.number and t.hits >= self.min_hits:  # confirmed, count once
+                c = int(t.cls)
+                self.counts[c] = self.counts.get(c, 0) + 1
+                t.number = self.counts[c]
+        ids = np.array([t.id for t in track_of], dtype=int)
+        numbers = np.array([t.number for t in track_of], dtype=int)
+        return det, ids, numbers
+
+    def predict(self):
+        # Advance all tracks one frame, returns predicted boxes of confirmed tracks matched at the last detection
+        for t in self.tracks:
+            t.predict()
+        tracks = [t for t in self.tracks if t.number and not t.misses]
+        det = np.array([(*t.xyxy, t.conf, t.cls) for t in tracks], dtype=np.float32).reshape(-1, 6)
+        return det, np.array([t.id for t in tracks], dtype=int), np.array([t.number for t in tracks], dtype=int)